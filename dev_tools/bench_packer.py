@@ -0,0 +1,35 @@
+# Benchmark of built-in island packer (muv_packer) without Blender
+#
+# Usage: python bench_packer.py [num_islands] [seed]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "uv_magic_uv"))
+import muv_packer     # noqa: E402
+
+
+def main():
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    rng = np.random.RandomState(seed)
+    sizes = rng.lognormal(mean=-4.0, sigma=0.6, size=(num, 2))
+
+    for rotate in (False, True):
+        for margin in (0.0, 0.001):
+            start = time.perf_counter()
+            result = muv_packer.pack_rects(sizes, margin, rotate)
+            elapsed = time.perf_counter() - start
+            print("islands={0} rotate={1} margin={2}: {3:.3f} sec, "
+                  "utilization={4:.1f} %".format(
+                      num, rotate, margin, elapsed,
+                      result.utilization * 100.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -217,6 +217,7 @@ class TestUVMagicUV(TestBase):
         # World Scale UV
         ('OPERATOR', 'uv.muv_wsuv_measure'),
         ('OPERATOR', 'uv.muv_wsuv_apply'),
+        ('OPERATOR', 'uv.muv_wsuv_report'),
 
         # Unwrap Constraint
         ('OPERATOR', 'uv.muv_unwrap_constraint'),
@@ -224,6 +225,9 @@ class TestUVMagicUV(TestBase):
         # Preserve UV Aspect
         ('MENU', 'uv.muv_preserve_uv_aspect_menu'),
         ('OPERATOR', 'uv.muv_preserve_uv_aspect'),
+
+        # Profiling
+        ('OPERATOR', 'uv.muv_profile_clear'),
     ]
 
     def setUp(self):
@@ -692,6 +696,24 @@ class TestUVMagicUV(TestBase):
         )
         self.assertSetEqual(result, {'FINISHED'})
 
+        print("[TEST] (OK) Match rotated/mirrored islands")
+        result = bpy.ops.uv.muv_packuv(match_transformed=True)
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (OK) Built-in packer")
+        result = bpy.ops.uv.muv_packuv(engine='NATIVE', rotate=True)
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (OK) Repeat with different margin")
+        result = bpy.ops.uv.muv_packuv(margin=0.05)
+        self.assertSetEqual(result, {'FINISHED'})
+        result = bpy.ops.uv.muv_packuv(margin=0.05)
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (OK) Selected objects")
+        result = bpy.ops.uv.muv_packuv(multi_object=True)
+        self.assertSetEqual(result, {'FINISHED'})
+
     # can not test interactive mode
     def test_texlock(self):
         print("======== Texture Lock ========")
@@ -769,6 +791,25 @@ class TestUVMagicUV(TestBase):
         result = bpy.ops.uv.muv_mirror_uv(axis='Y', error=19.4)
         self.assertSetEqual(result, {'FINISHED'})
 
+        print("[TEST] (OK) Repeat with same option")
+        result = bpy.ops.uv.muv_mirror_uv(axis='Y', error=19.4)
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (OK) Arbitrary plane")
+        result = bpy.ops.uv.muv_mirror_uv(
+            axis='PLANE', plane_co=(0.0, 0.5, 0.0),
+            plane_normal=(1.0, 1.0, 0.0))
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (Fail) Zero plane normal")
+        result = bpy.ops.uv.muv_mirror_uv(
+            axis='PLANE', plane_normal=(0.0, 0.0, 0.0))
+        self.assertSetEqual(result, {'CANCELLED'})
+
+        print("[TEST] (OK) Auto detected plane")
+        result = bpy.ops.uv.muv_mirror_uv(axis='AUTO')
+        self.assertSetEqual(result, {'FINISHED'})
+
     def test_wsuv(self):
         print("======== World Scale UV ========")
         obj_name = "Cube"
@@ -794,12 +835,47 @@ class TestUVMagicUV(TestBase):
         result = bpy.ops.uv.muv_wsuv_measure()
         self.assertSetEqual(result, {'FINISHED'})
 
+        print("[TEST] (OK) (Measure) Area based")
+        result = bpy.ops.uv.muv_wsuv_measure(method='AREA')
+        self.assertSetEqual(result, {'FINISHED'})
+
+        print("[TEST] (OK) (Report)")
+        result = bpy.ops.uv.muv_wsuv_report()
+        self.assertSetEqual(result, {'FINISHED'})
+        result = bpy.ops.uv.muv_wsuv_report()
+        self.assertSetEqual(result, {'FINISHED'})
+
         # bpy.context.area has no type from cmdline
         # print("[TEST] (OK) (Apply)")
         # bpy.ops.mesh.uv_texture_add()
         # result = bpy.ops.uv.muv_wsuv_apply()
         # self.assertSetEqual(result, {'FINISHED'})
 
+        print("[TEST] (OK) (Apply) Per island")
+        # two islands on opposite faces with different texel density
+        props = bpy.context.scene.muv_props.wsuv
+        bm = bmesh.from_edit_mesh(active_obj.data)
+        uv_layer = bm.loops.layers.uv.verify()
+        face_a = [f for f in bm.faces if f.normal.z > 0.5][0]
+        face_b = [f for f in bm.faces if f.normal.z < -0.5][0]
+        for f, s, o in ((face_a, 0.1, 0.0), (face_b, 0.3, 0.5)):
+            for l in f.loops:
+                l[uv_layer].uv = (l.vert.co.x * s + o, l.vert.co.y * s + o)
+        for f in bm.faces:
+            f.select = f == face_a
+        result = bpy.ops.uv.muv_wsuv_measure(method='AREA')
+        self.assertSetEqual(result, {'FINISHED'})
+        ref_scale = props.ref_scale
+        face_b.select = True
+        result = bpy.ops.uv.muv_wsuv_apply(method='AREA', per_island=True)
+        self.assertSetEqual(result, {'FINISHED'})
+        for f in (face_a, face_b):
+            for g in bm.faces:
+                g.select = g == f
+            result = bpy.ops.uv.muv_wsuv_measure(method='AREA')
+            self.assertSetEqual(result, {'FINISHED'})
+            self.assertAlmostEqual(props.ref_scale, ref_scale, places=4)
+
     def test_unwrapconst(self):
         print("======== Unwrap Constraint ========")
         obj_name = "Cube"
@@ -833,6 +909,48 @@ class TestUVMagicUV(TestBase):
         )
         self.assertSetEqual(result, {'FINISHED'})
 
+    def test_uvw(self):
+        print("======== UVW ========")
+        obj_name = "Cube"
+        uv_map = "UVMap"
+
+        select_object_only(obj_name)
+        bpy.context.scene.objects.active = bpy.data.objects[obj_name]
+        active_obj = bpy.context.scene.objects.active
+        bpy.ops.object.mode_set(mode='EDIT')
+        bm = bmesh.from_edit_mesh(active_obj.data)
+
+        print("[TEST] (Fail) No UV")
+        bpy.ops.mesh.select_all(action='SELECT')
+        result = bpy.ops.uv.muv_uvw_box_map()
+        self.assertSetEqual(result, {'CANCELLED'})
+
+        print("[TEST] (OK) Box map")
+        bpy.ops.mesh.uv_texture_add()
+        result = bpy.ops.uv.muv_uvw_box_map()
+        self.assertSetEqual(result, {'FINISHED'})
+
+        for op in (bpy.ops.uv.muv_uvw_box_map,
+                   bpy.ops.uv.muv_uvw_best_planer_map):
+            print("[TEST] (OK) Map again after moving vertex")
+            result = op()
+            self.assertSetEqual(result, {'FINISHED'})
+            bm = bmesh.from_edit_mesh(active_obj.data)
+            bm.verts.ensure_lookup_table()
+            uv_layer = bm.loops.layers.uv.verify()
+            v = bm.verts[0]
+            uvs_before = [l[uv_layer].uv.copy() for l in v.link_loops]
+            v.co.x += 0.25
+            bmesh.update_edit_mesh(active_obj.data)
+            result = op()
+            self.assertSetEqual(result, {'FINISHED'})
+            bm = bmesh.from_edit_mesh(active_obj.data)
+            bm.verts.ensure_lookup_table()
+            uv_layer = bm.loops.layers.uv.verify()
+            uvs_after = [l[uv_layer].uv.copy()
+                         for l in bm.verts[0].link_loops]
+            self.assertNotEqual(uvs_before, uvs_after)
+
     def test_preserve_uv_aspect(self):
         print("======== Preserve UV Aspect ========")
         obj_name = "Cube"
@@ -860,6 +978,18 @@ class TestUVMagicUV(TestBase):
         result = bpy.ops.uv.muv_preserve_uv_aspect(dest_img_name='Test')
         self.assertSetEqual(result, {'FINISHED'})
 
+        print("[TEST] (OK) Selected objects")
+        result = bpy.ops.uv.muv_preserve_uv_aspect(
+            dest_img_name='Test', multi_object=True)
+        self.assertSetEqual(result, {'FINISHED'})
+
+    def test_profile(self):
+        print("======== Profiling ========")
+
+        print("[TEST] (OK) Clear")
+        result = bpy.ops.uv.muv_profile_clear()
+        self.assertSetEqual(result, {'FINISHED'})
+
 
 if __name__ == "__main__":
     test_cases = [
@@ -53,6 +53,7 @@ if "bpy" in locals():
     importlib.reload(muv_uvbb_ops)
     importlib.reload(muv_mvuv_ops)
     importlib.reload(muv_texproj_ops)
+    importlib.reload(muv_packer)
     importlib.reload(muv_packuv_ops)
     importlib.reload(muv_texlock_ops)
     importlib.reload(muv_mirroruv_ops)
@@ -61,6 +62,7 @@ if "bpy" in locals():
     importlib.reload(muv_preserve_uv_aspect)
     importlib.reload(muv_uvw_ops)
     importlib.reload(muv_auvc_ops)
+    importlib.reload(muv_profile)
 else:
     from . import muv_preferences
     from . import muv_menu
@@ -73,6 +75,7 @@ else:
     from . import muv_uvbb_ops
     from . import muv_mvuv_ops
     from . import muv_texproj_ops
+    from . import muv_packer
     from . import muv_packuv_ops
     from . import muv_texlock_ops
     from . import muv_mirroruv_ops
@@ -81,6 +84,7 @@ else:
     from . import muv_preserve_uv_aspect
     from . import muv_uvw_ops
     from . import muv_auvc_ops
+    from . import muv_profile
 
 import bpy
 
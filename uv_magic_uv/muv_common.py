@@ -24,8 +24,10 @@ __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
 
-from collections import defaultdict
+import time
+from collections import defaultdict, OrderedDict
 
+import numpy as np
 import bpy
 from mathutils import Vector
 import bmesh
@@ -43,6 +45,38 @@ def debug_print(*s):
         print(s)
 
 
+class PhaseTimer():
+    """
+    Record elapsed time of each processing phase to profile properties
+    """
+
+    def __init__(self, profile, name):
+        self.__name = name
+        self.__timings = OrderedDict()
+        self.__counters = OrderedDict()
+        profile.timings[name] = self.__timings
+        profile.counters[name] = self.__counters
+        self.__start = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Record elapsed time from previous lap as phase
+        """
+
+        now = time.perf_counter()
+        self.__timings[phase] = now - self.__start
+        debug_print("[{0}] {1}: {2:.6f} sec".format(
+            self.__name, phase, now - self.__start))
+        self.__start = now
+
+    def count(self, counter, value):
+        """
+        Record counter value
+        """
+
+        self.__counters[counter] = value
+
+
 def check_version(major, minor, _):
     """
     Check blender version
@@ -66,6 +100,105 @@ def redraw_all_areas():
         area.tag_redraw()
 
 
+def get_vert_co_array(verts):
+    """
+    Get coordinates of vertices as (N, 3) array
+    """
+
+    return np.array([v.co[:] for v in verts], dtype=np.float64).reshape(-1, 3)
+
+
+def get_loop_co_array(loops):
+    """
+    Get vertex coordinates of loops as (N, 3) array
+    """
+
+    return np.array(
+        [l.vert.co[:] for l in loops], dtype=np.float64).reshape(-1, 3)
+
+
+def get_loop_uv_array(loops, uv_layer):
+    """
+    Get UV coordinates of loops as (N, 2) array
+    """
+
+    return np.array(
+        [l[uv_layer].uv[:] for l in loops], dtype=np.float64).reshape(-1, 2)
+
+
+def set_loop_uv_array(loops, uv_layer, uvs):
+    """
+    Set UV coordinates of loops from (N, 2) array
+    """
+
+    for l, uv in zip(loops, uvs.tolist()):
+        l[uv_layer].uv = uv
+
+
+def get_selected_mesh_objects(context):
+    """
+    Get active object and other selected mesh objects
+    (Objects which share mesh data with others are returned only once)
+    """
+
+    objs = []
+    meshes = set()
+    for obj in [context.active_object] + list(context.selected_objects):
+        if obj is None or obj.type != 'MESH' or obj.data in meshes:
+            continue
+        objs.append(obj)
+        meshes.add(obj.data)
+
+    return objs
+
+
+def get_object_bmesh(obj):
+    """
+    Get BMesh of object
+    BMesh is newly created if object is not in edit mode, so it must be
+    written back by update_object_bmesh()
+    """
+
+    if obj.data.is_editmode:
+        bm = bmesh.from_edit_mesh(obj.data)
+    else:
+        bm = bmesh.new()
+        bm.from_mesh(obj.data)
+    if check_version(2, 73, 0) >= 0:
+        bm.verts.ensure_lookup_table()
+        bm.edges.ensure_lookup_table()
+        bm.faces.ensure_lookup_table()
+
+    return bm
+
+
+def update_object_bmesh(obj, bm, free=True):
+    """
+    Write back BMesh which is got by get_object_bmesh()
+    BMesh created for object not in edit mode is freed unless free is False
+    """
+
+    if obj.data.is_editmode:
+        bmesh.update_edit_mesh(obj.data)
+    else:
+        bm.to_mesh(obj.data)
+        obj.data.update()
+        if free:
+            bm.free()
+
+
+def get_object_target_faces(obj, bm):
+    """
+    Get faces to be processed
+    Selected faces are processed in edit mode, otherwise all faces are
+    processed
+    """
+
+    if obj.data.is_editmode:
+        return [f for f in bm.faces if f.select]
+    return list(bm.faces)
+
+
 def get_space(area_type, region_type, space_type):
     """
     Get current area/region/space
@@ -187,6 +320,11 @@ def get_island_info(obj, only_selected=True):
     bm = bmesh.from_edit_mesh(obj.data)
     if check_version(2, 73, 0) >= 0:
         bm.faces.ensure_lookup_table()
+
+    return get_island_info_from_bmesh(bm, only_selected)
+
+
+def get_island_info_from_bmesh(bm, only_selected=True):
     if not bm.loops.layers.uv:
         return None
     uv_layer = bm.loops.layers.uv.verify()
@@ -205,6 +343,103 @@ def get_island_info(obj, only_selected=True):
     return island_info
 
 
+def get_island_bounds(island_info):
+    """
+    Get minimum and maximum UV coordinates of islands as (N, 2) arrays
+    """
+
+    mins = np.array(
+        [isl['min'][:] for isl in island_info], dtype=np.float64)
+    maxs = np.array(
+        [isl['max'][:] for isl in island_info], dtype=np.float64)
+
+    return mins.reshape(-1, 2), maxs.reshape(-1, 2)
+
+
+def get_island_labels(vidx, uvs, offsets):
+    """
+    Get index of UV island which each face belongs to, and number of islands
+    Faces are in same island if they share vertex with same UV coordinate
+    (compared in 5 digits as get_island_info does)
+    vidx and uvs are vertex indices and UV coordinates of loops, and offsets
+    are indices of the first loop of each face followed by number of loops
+    """
+
+    num_faces = len(offsets) - 1
+    if num_faces <= 0:
+        return np.zeros(0, dtype=np.int64), 0
+
+    # identify loops which share vertex and UV coordinate
+    ruvs = np.round(uvs, 5)
+    order = np.lexsort((ruvs[:, 1], ruvs[:, 0], vidx))
+    keys = np.column_stack((vidx[order], ruvs[order]))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    starts = np.nonzero(first)[0]
+
+    # propagate minimum face index through shared vertices until converged
+    loop_faces = np.repeat(np.arange(num_faces), np.diff(offsets))
+    labels = np.arange(num_faces)
+    while True:
+        shared_min = np.minimum.reduceat(labels[loop_faces[order]], starts)
+        loop_min = np.empty(len(order), dtype=np.int64)
+        loop_min[order] = np.repeat(shared_min, np.diff(
+            np.append(starts, len(order))))
+        new_labels = np.minimum.reduceat(loop_min, offsets[:-1])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    _, labels = np.unique(labels, return_inverse=True)
+
+    return labels, int(labels.max()) + 1
+
+
+def get_uv_anchors(uvs, labels, num_groups):
+    """
+    Get anchor points of each group of UV coordinates
+    Return dictionary from anchor name ('CENTER', 'LEFT_TOP', ...,
+    'RIGHT_BOTTOM') to (num_groups, 2) array
+    Anchors of empty group are (0, 0)
+    """
+
+    mins = np.zeros((num_groups, 2))
+    maxs = np.zeros((num_groups, 2))
+    means = np.zeros((num_groups, 2))
+    if len(uvs) > 0:
+        order = np.argsort(labels, kind='mergesort')
+        sorted_labels = labels[order]
+        sorted_uvs = uvs[order]
+        starts = np.flatnonzero(
+            np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        groups = sorted_labels[starts]
+        counts = np.diff(np.append(starts, len(uvs)))
+        mins[groups] = np.minimum.reduceat(sorted_uvs, starts)
+        maxs[groups] = np.maximum.reduceat(sorted_uvs, starts)
+        means[groups] = np.add.reduceat(sorted_uvs, starts) / \
+            counts[:, np.newaxis]
+
+    xs = {'LEFT': mins[:, 0], 'CENTER': means[:, 0], 'RIGHT': maxs[:, 0]}
+    ys = {'TOP': maxs[:, 1], 'CENTER': means[:, 1], 'BOTTOM': mins[:, 1]}
+    anchors = {'CENTER': means}
+    for x in ('LEFT', 'CENTER', 'RIGHT'):
+        for y in ('TOP', 'CENTER', 'BOTTOM'):
+            if x != 'CENTER' or y != 'CENTER':
+                anchors[x + '_' + y] = np.column_stack((xs[x], ys[y]))
+
+    return anchors
+
+
+def scale_uv_groups(uvs, labels, origins, factors):
+    """
+    Scale UV coordinates about origin of the group which they belong to
+    factors is (num_groups, 1) or (num_groups, 2) array
+    """
+
+    origins = origins[labels]
+    return origins + (uvs - origins) * factors[labels]
+
+
 def get_uvimg_editor_board_size(area):
     if area.spaces.active.image:
         return area.spaces.active.image.size
@@ -120,6 +120,8 @@ class MUV_WSUVMenu(bpy.types.Menu):
             muv_wsuv_ops.MUV_WSUVMeasure.bl_idname, icon="IMAGE_COL")
         self.layout.operator(
             muv_wsuv_ops.MUV_WSUVApply.bl_idname, icon="IMAGE_COL")
+        self.layout.operator(
+            muv_wsuv_ops.MUV_WSUVReport.bl_idname, icon="IMAGE_COL")
 
 
 class MUV_UVWMenu(bpy.types.Menu):
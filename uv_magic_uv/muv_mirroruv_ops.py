@@ -23,16 +23,150 @@ __status__ = "production"
 __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
+from itertools import product
+from math import sqrt
+
+import numpy as np
 import bpy
 from bpy.props import (
     EnumProperty,
     FloatProperty,
+    FloatVectorProperty,
 )
 import bmesh
-from mathutils import Vector
+import mathutils
 from . import muv_common
 
 
+def get_spatial_hash(cells):
+    """
+    Get hash value of integer cell coordinates
+    Different cells may have same hash value
+    """
+    return (cells[:, 0] * 73856093) ^ (cells[:, 1] * 19349663) ^ \
+        (cells[:, 2] * 83492791)
+
+
+# maximum number of vertices in a cell of spatial hash, KD-tree is used
+# instead if vertices are crowded (i.e. error is large for the mesh)
+MAX_CELL_VERTS = 32
+
+
+def get_mirror_vert_map_kdtree(co, mirrored, error):
+    """
+    Get index of nearest vertex which is located at mirrored coordinate of
+    each vertex, within an error threshold, by KD-tree
+    """
+    vert_map = np.full(len(co), -1, dtype=np.int64)
+    kd = mathutils.kdtree.KDTree(len(co))
+    for i, c in enumerate(co.tolist()):
+        kd.insert(c, i)
+    kd.balance()
+
+    for i, m in enumerate(mirrored.tolist()):
+        _, j, _ = kd.find(m)
+        if j is not None and np.all(np.abs(co[j] - mirrored[i]) < error):
+            vert_map[i] = j
+
+    return vert_map
+
+
+def get_mirror_vert_map(co, mirrored, error):
+    """
+    Get index of vertex which is located at mirrored coordinate of each
+    vertex, within an error threshold
+    Return -1 for vertex which does not have mirrored vertex
+    """
+    vert_map = np.full(len(co), -1, dtype=np.int64)
+    if len(co) == 0 or error <= 0.0:
+        return vert_map
+
+    # register vertices to spatial hash whose cell size is same as error
+    keys = get_spatial_hash(np.floor(co / error).astype(np.int64))
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+
+    # comparing all vertices in crowded cells is O(V^2)
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    if np.diff(np.append(starts, len(keys))).max() > MAX_CELL_VERTS:
+        return get_mirror_vert_map_kdtree(co, mirrored, error)
+
+    # search vertices in neighbouring cells of mirrored coordinate
+    cells = np.floor(mirrored / error).astype(np.int64)
+    best = np.full(len(co), np.inf)
+    for d in product((-1, 0, 1), repeat=3):
+        query = get_spatial_hash(cells + np.array(d, dtype=np.int64))
+        lo = np.searchsorted(sorted_keys, query, side='left')
+        num = np.searchsorted(sorted_keys, query, side='right') - lo
+        for k in range(int(num.max())):
+            idx = np.nonzero(num > k)[0]
+            cand = order[lo[idx] + k]
+            diff = np.abs(co[cand] - mirrored[idx])
+            dist = (diff * diff).sum(axis=1)
+            ok = np.all(diff < error, axis=1) & (dist < best[idx])
+            vert_map[idx[ok]] = cand[ok]
+            best[idx[ok]] = dist[ok]
+
+    return vert_map
+
+
+def mirror_coords(co, point, normal):
+    """
+    Mirror coordinates by the plane
+    """
+    dist = (co - point).dot(normal)
+    return co - 2.0 * dist[:, np.newaxis] * normal
+
+
+def find_symmetry_plane(co, error, num_refine=3):
+    """
+    Find the plane which vertices are most symmetric about
+    Principal axes and object axes through the centroid are tried, and the
+    best plane is refined by pairs of mirrored vertices
+    Return point and normal of the plane, and ratio of mirrored vertices
+    """
+    if len(co) == 0:
+        return np.zeros(3), np.eye(3)[0], 0.0
+
+    center = co.mean(axis=0)
+    candidates = [np.eye(3)[i] for i in range(3)]
+    if len(co) >= 3:
+        _, vecs = np.linalg.eigh(np.cov((co - center).T))
+        candidates = [vecs[:, i] for i in range(3)] + candidates
+
+    def score(point, normal):
+        vert_map = get_mirror_vert_map(
+            co, mirror_coords(co, point, normal), error)
+        return np.count_nonzero(vert_map >= 0) / len(co), vert_map
+
+    best = None
+    for normal in candidates:
+        ratio, vert_map = score(center, normal)
+        if best is None or ratio > best[2]:
+            best = (center, normal, ratio, vert_map)
+
+    point, normal, ratio, vert_map = best
+    for _ in range(num_refine):
+        src = np.nonzero(vert_map >= 0)[0]
+        if len(src) == 0:
+            break
+        diff = co[src] - co[vert_map[src]]
+        diff[diff.dot(normal) < 0.0] *= -1.0
+        new_normal = diff.sum(axis=0)
+        length = np.linalg.norm(new_normal)
+        if length == 0.0:
+            break
+        new_normal /= length
+        new_point = (co[src] + co[vert_map[src]]).mean(axis=0) * 0.5
+        new_ratio, new_vert_map = score(new_point, new_normal)
+        if new_ratio <= ratio:
+            break
+        point, normal, ratio, vert_map = \
+            new_point, new_normal, new_ratio, new_vert_map
+
+    return point, normal, ratio
+
+
 class MUV_MirrorUV(bpy.types.Operator):
     """
     Operation class: Mirror UV
@@ -46,12 +180,29 @@ class MUV_MirrorUV(bpy.types.Operator):
         items=(
             ('X', "X", "Mirror Along X axis"),
             ('Y', "Y", "Mirror Along Y axis"),
-            ('Z', "Z", "Mirror Along Z axis")
+            ('Z', "Z", "Mirror Along Z axis"),
+            ('PLANE', "Plane", "Mirror by specified plane"),
+            ('AUTO', "Auto", "Mirror by the plane which mesh is most "
+                             "symmetric about")
         ),
         name="Axis",
         description="Mirror Axis",
         default='X'
     )
+    plane_co = FloatVectorProperty(
+        name="Plane Point",
+        description="Point on the mirror plane (Object space)",
+        size=3,
+        default=(0.0, 0.0, 0.0),
+        subtype='XYZ'
+    )
+    plane_normal = FloatVectorProperty(
+        name="Plane Normal",
+        description="Normal of the mirror plane (Object space)",
+        size=3,
+        default=(1.0, 0.0, 0.0),
+        subtype='XYZ'
+    )
     error = FloatProperty(
         name="Error",
         description="Error threshold",
@@ -62,44 +213,79 @@ class MUV_MirrorUV(bpy.types.Operator):
         soft_max=1.0
     )
 
-    def __is_vector_similar(self, v1, v2, error):
+    def __get_plane(self, context, obj, co, error):
         """
-        Check if two vectors are similar, within an error threshold
+        Get point and normal of the mirror plane
+        Automatically found plane is cached until mesh, error or vertex
+        coordinates are changed
         """
-        within_err_x = abs(v2.x - v1.x) < error
-        within_err_y = abs(v2.y - v1.y) < error
-        within_err_z = abs(v2.z - v1.z) < error
+        if self.axis in ('X', 'Y', 'Z'):
+            return np.zeros(3), np.eye(3)["XYZ".index(self.axis)]
+        if self.axis == 'PLANE':
+            normal = np.array(self.plane_normal[:], dtype=np.float64)
+            length = np.linalg.norm(normal)
+            if length == 0.0:
+                return None
+            return np.array(self.plane_co[:], dtype=np.float64), \
+                normal / length
 
-        return within_err_x and within_err_y and within_err_z
+        props = context.scene.muv_props.mirroruv
+        key = (obj.data.name, error, hash(co.tobytes()))
+        if props.plane_key != key:
+            point, normal, ratio = find_symmetry_plane(co, error)
+            props.plane = (point, normal, ratio)
+            props.plane_key = key
+        point, normal, ratio = props.plane
+        self.report(
+            {'INFO'},
+            "Plane: Point ({0[0]:.4f}, {0[1]:.4f}, {0[2]:.4f}), "
+            "Normal ({1[0]:.4f}, {1[1]:.4f}, {1[2]:.4f}), "
+            "Mirrored Vertices {2:.1f} %".format(point, normal, ratio * 100))
 
-    def __mirror_uvs(self, uv_layer, src, dst, axis, error):
+        return point, normal
+
+    def __get_vert_map(self, context, obj, co, plane, error):
+        """
+        Get map from vertex to mirrored vertex
+        Map is cached until mesh, plane, error or vertex coordinates are
+        changed
+        """
+        props = context.scene.muv_props.mirroruv
+        key = (obj.data.name, tuple(plane[0]), tuple(plane[1]), error,
+               hash(co.tobytes()))
+        if props.vert_map_key == key:
+            return props.vert_map
+
+        props.vert_map = get_mirror_vert_map(
+            co, mirror_coords(co, *plane), error)
+        props.vert_map_key = key
+
+        return props.vert_map
+
+    def __get_mirror_loops(self, src, dst, vert_map):
         """
-        Copy UV coordinates from one UV face to another
+        Get pairs of loops to copy UV coordinates from one UV face to another
         """
-        for sl in src.loops:
-            suv = sl[uv_layer].uv.copy()
-            svco = sl.vert.co.copy()
-            for dl in dst.loops:
-                dvco = dl.vert.co.copy()
-                if axis == 'X':
-                    dvco.x = -dvco.x
-                elif axis == 'Y':
-                    dvco.y = -dvco.y
-                elif axis == 'Z':
-                    dvco.z = -dvco.z
-
-                if self.__is_vector_similar(svco, dvco, error):
-                    dl[uv_layer].uv = suv.copy()
-
-    def __get_face_center(self, face):
+        src_loops = {l.vert.index: l for l in src.loops}
+        pairs = []
+        for dl in dst.loops:
+            sl = src_loops.get(vert_map[dl.vert.index])
+            if sl is not None:
+                pairs.append((sl, dl))
+
+        return pairs
+
+    def __get_mirrored_face_kdtree(self, centers, plane):
         """
-        Get center coordinate of the face
+        Build KD-tree of face centers mirrored by the plane
         """
-        center = Vector((0.0, 0.0, 0.0))
-        for v in face.verts:
-            center = center + v.co
+        mirrored = mirror_coords(centers, *plane)
+        kd = mathutils.kdtree.KDTree(len(mirrored))
+        for i, co in enumerate(mirrored.tolist()):
+            kd.insert(co, i)
+        kd.balance()
 
-        return center / len(face.verts)
+        return kd, mirrored
 
     @classmethod
     def poll(cls, context):
@@ -111,7 +297,6 @@ class MUV_MirrorUV(bpy.types.Operator):
         bm = bmesh.from_edit_mesh(obj.data)
 
         error = self.error
-        axis = self.axis
 
         if muv_common.check_version(2, 73, 0) >= 0:
             bm.faces.ensure_lookup_table()
@@ -120,34 +305,55 @@ class MUV_MirrorUV(bpy.types.Operator):
             return {'CANCELLED'}
         uv_layer = bm.loops.layers.uv.verify()
 
-        faces = [f for f in bm.faces if f.select]
-        for f_dst in faces:
+        bm.verts.ensure_lookup_table()
+        co = muv_common.get_vert_co_array(bm.verts)
+        plane = self.__get_plane(context, obj, co, error)
+        if plane is None:
+            self.report({'WARNING'}, "Plane normal must not be zero")
+            return {'CANCELLED'}
+
+        centers = np.array(
+            [f.calc_center_median()[:] for f in bm.faces],
+            dtype=np.float64).reshape(-1, 3)
+        side = (centers - plane[0]).dot(plane[1])
+        kd, mirrored = self.__get_mirrored_face_kdtree(centers, plane)
+        vert_map = self.__get_vert_map(context, obj, co, plane, error)
+
+        # vectors are similar if each component is within error, so
+        # candidates are searched in the sphere which contains the cube
+        radius = error * sqrt(3.0)
+        faces = [i for i, f in enumerate(bm.faces) if f.select]
+        pairs = []
+        for i_dst in faces:
+            f_dst = bm.faces[i_dst]
+            dst = centers[i_dst]
             count = len(f_dst.verts)
-            for f_src in bm.faces:
+            found = kd.find_range(dst.tolist(), radius)
+            for i_src in sorted(idx for _, idx, _ in found):
+                f_src = bm.faces[i_src]
                 # check if this is a candidate to do mirror UV
-                if f_src.index == f_dst.index:
+                if i_src == i_dst:
                     continue
                 if count != len(f_src.verts):
                     continue
 
-                # test if the vertices x values are the same sign
-                dst = self.__get_face_center(f_dst)
-                src = self.__get_face_center(f_src)
-                if (dst.x > 0 and src.x > 0) or (dst.x < 0 and src.x < 0):
+                # test if the face centers are the same side of the plane
+                if (side[i_dst] > 0 and side[i_src] > 0) or \
+                        (side[i_dst] < 0 and side[i_src] < 0):
                     continue
 
-                # invert source axis
-                if axis == 'X':
-                    src.x = -src.x
-                elif axis == 'Y':
-                    src.y = -src.z
-                elif axis == 'Z':
-                    src.z = -src.z
-
-                # do mirror UV
-                if self.__is_vector_similar(dst, src, error):
-                    self.__mirror_uvs(
-                        uv_layer, f_src, f_dst, self.axis, self.error)
+                if np.all(np.abs(mirrored[i_src] - dst) < error):
+                    pairs.extend(
+                        self.__get_mirror_loops(f_src, f_dst, vert_map))
+
+        # do mirror UV
+        # UV coordinates are copied as if pairs are processed in order, so
+        # source loop which is already overwritten passes the new UV
+        origin = {}
+        for sl, dl in pairs:
+            origin[dl] = origin.get(sl, sl)
+        uvs = muv_common.get_loop_uv_array(list(origin.values()), uv_layer)
+        muv_common.set_loop_uv_array(list(origin.keys()), uv_layer, uvs)
 
         bmesh.update_edit_mesh(obj.data)
 
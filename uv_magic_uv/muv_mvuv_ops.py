@@ -23,10 +23,13 @@ __status__ = "production"
 __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
+import numpy as np
 import bpy
-import bmesh
+from bpy.props import BoolProperty
 from mathutils import Vector
 
+from . import muv_common
+
 
 class MUV_MVUV(bpy.types.Operator):
     """
@@ -37,27 +40,76 @@ class MUV_MVUV(bpy.types.Operator):
     bl_label = "Move the UV from View3D"
     bl_options = {'REGISTER', 'UNDO'}
 
+    # interval of writing UV coordinates back to mesh (sec)
+    UPDATE_INTERVAL = 1.0 / 60.0
+
+    multi_object = BoolProperty(
+        name="Selected Objects",
+        description="Move UV of all selected mesh objects "
+                    "(All faces are processed in objects not in edit mode)",
+        default=False
+    )
+
     def __init__(self):
-        self.__topology_dict = []
+        self.__segments = []
+        self.__ini_uvs = np.zeros((0, 2))
         self.__prev_mouse = Vector((0.0, 0.0))
         self.__offset_uv = Vector((0.0, 0.0))
         self.__prev_offset_uv = Vector((0.0, 0.0))
+        self.__move = np.zeros(2)
+        self.__dirty = False
+        self.__timer = None
         self.__first_time = True
-        self.__ini_uvs = []
         self.__running = False
 
     def __find_uv(self, context):
-        bm = bmesh.from_edit_mesh(context.object.data)
-        topology_dict = []
+        """
+        Find loops of selected vertices in object in edit mode, and all
+        loops in other selected mesh objects if multi_object is enabled
+        Return segments (object, BMesh, UV layer, loops, first index in UV
+        array) and initial UV array
+        """
+        segments = []
         uvs = []
-        active_uv = bm.loops.layers.uv.active
-        for fidx, f in enumerate(bm.faces):
-            for vidx, v in enumerate(f.verts):
-                if v.select:
-                    uvs.append(f.loops[vidx][active_uv].uv.copy())
-                    topology_dict.append([fidx, vidx])
-
-        return topology_dict, uvs
+        num = 0
+        if self.multi_object:
+            objs = muv_common.get_selected_mesh_objects(context)
+        else:
+            objs = [context.edit_object]
+        for obj in objs:
+            bm = muv_common.get_object_bmesh(obj)
+            active_uv = bm.loops.layers.uv.active
+            if active_uv is None:
+                if not obj.data.is_editmode:
+                    bm.free()
+                continue
+            if obj.data.is_editmode:
+                loops = [l for f in bm.faces for l in f.loops
+                         if l.vert.select]
+            else:
+                loops = [l for f in bm.faces for l in f.loops]
+            segments.append((obj, bm, active_uv, loops, num))
+            uvs.append(muv_common.get_loop_uv_array(loops, active_uv))
+            num += len(loops)
+        if not segments:
+            return [], np.zeros((0, 2))
+
+        return segments, np.concatenate(uvs)
+
+    def __update_uv(self, uvs):
+        for obj, bm, active_uv, loops, first in self.__segments:
+            muv_common.set_loop_uv_array(
+                loops, active_uv, uvs[first:first + len(loops)])
+            muv_common.update_object_bmesh(obj, bm, free=False)
+        self.__dirty = False
+
+    def __finish(self, context):
+        context.window_manager.event_timer_remove(self.__timer)
+        self.__timer = None
+        for obj, bm, _, _, _ in self.__segments:
+            if not obj.data.is_editmode:
+                bm.free()
+        self.__segments = []
 
     @classmethod
     def poll(cls, context):
@@ -89,14 +141,13 @@ class MUV_MVUV(bpy.types.Operator):
                 self.__running = False
             return {'RUNNING_MODAL'}
 
-        # update UV
-        obj = context.object
-        bm = bmesh.from_edit_mesh(obj.data)
-        active_uv = bm.loops.layers.uv.active
-        for fidx, vidx in self.__topology_dict:
-            l = bm.faces[fidx].loops[vidx]
-            l[active_uv].uv = l[active_uv].uv + dv
-        bmesh.update_edit_mesh(obj.data)
+        # accumulate movement, and UV coordinates are updated at most once
+        # per timer event
+        if dv.x != 0.0 or dv.y != 0.0:
+            self.__move += dv[:]
+            self.__dirty = True
+        if event.type == 'TIMER' and self.__dirty:
+            self.__update_uv(self.__ini_uvs + self.__move)
 
         # check mouse preference
         if context.user_preferences.inputs.select_mouse == 'RIGHT':
@@ -108,18 +159,30 @@ class MUV_MVUV(bpy.types.Operator):
 
         # cancelled
         if event.type == cancel_btn and event.value == 'PRESS':
-            for (fidx, vidx), uv in zip(self.__topology_dict, self.__ini_uvs):
-                bm.faces[fidx].loops[vidx][active_uv].uv = uv
+            self.__update_uv(self.__ini_uvs)
+            self.__finish(context)
             return {'FINISHED'}
         # confirmed
         if event.type == confirm_btn and event.value == 'PRESS':
+            if self.__dirty:
+                self.__update_uv(self.__ini_uvs + self.__move)
+            self.__finish(context)
             return {'FINISHED'}
 
         return {'RUNNING_MODAL'}
 
     def execute(self, context):
+        self.__segments, self.__ini_uvs = self.__find_uv(context)
+        if not self.__segments:
+            self.report({'WARNING'}, "Object must have more than one UV map")
+            return {'CANCELLED'}
+
         self.__first_time = True
         self.__running = True
-        context.window_manager.modal_handler_add(self)
-        self.__topology_dict, self.__ini_uvs = self.__find_uv(context)
+        wm = context.window_manager
+        self.__timer = wm.event_timer_add(
+            self.UPDATE_INTERVAL, context.window)
+        wm.modal_handler_add(self)
+        self.__move = np.zeros(2)
+        self.__dirty = False
         return {'RUNNING_MODAL'}
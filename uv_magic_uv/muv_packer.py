@@ -0,0 +1,153 @@
+# <pep8-80 compliant>
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+__author__ = "Nutti <nutti.metro@gmail.com>"
+__status__ = "production"
+__version__ = "4.5"
+__date__ = "19 Nov 2017"
+
+# This module must not depend on bpy, so that packing can be run and
+# benchmarked outside Blender.
+
+from collections import namedtuple
+
+import numpy as np
+
+
+PackResult = namedtuple(
+    'PackResult', 'positions rotated sizes scale utilization')
+
+# ratio of bin width to square root of total area to be tried
+BIN_WIDTH_RATIOS = (1.0, 1.05, 1.1, 1.2, 1.35, 1.5)
+
+
+def pack_shelves(sizes, bin_width):
+    """
+    Pack rectangles into shelves by first fit decreasing height
+    Return positions of rectangles and packed width/height
+    """
+
+    num = len(sizes)
+    positions = np.zeros((num, 2))
+    if num == 0:
+        return positions, 0.0, 0.0
+
+    # sort by height, then width (larger first), then index
+    order = np.lexsort((np.arange(num), -sizes[:, 0], -sizes[:, 1]))
+    widths = sizes[order, 0].tolist()
+    heights = sizes[order, 1].tolist()
+    # shelves whose free width is less than this can not be used anymore
+    min_widths = np.minimum.accumulate(
+        sizes[order[::-1], 0])[::-1].tolist()
+
+    # open shelves (y, used width) in creation order
+    shelves = []
+    width = 0.0
+    top = 0.0
+    for k, i in enumerate(order.tolist()):
+        w = widths[k]
+        for s in shelves:
+            if s[1] + w <= bin_width:
+                break
+        else:
+            # open new shelf, whose height is decided by this rectangle
+            s = [top, 0.0]
+            shelves.append(s)
+            top = top + heights[k]
+        positions[i] = (s[1], s[0])
+        s[1] = s[1] + w
+        width = max(width, s[1])
+
+        # close shelves which have no room for rest rectangles
+        if k + 1 < num and bin_width - s[1] < min_widths[k + 1]:
+            shelves = [sh for sh in shelves
+                       if bin_width - sh[1] >= min_widths[k + 1]]
+
+    return positions, width, top
+
+
+def pack_rects(sizes, margin=0.0, rotate=False):
+    """
+    Pack rectangles into square whose side is 1.0
+    sizes: (N, 2) array of width and height of rectangles
+    margin: margin between rectangles after packed
+    rotate: rotate rectangles by 90 degree to be laid sideways
+    Result is deterministic for same inputs
+    """
+
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    num = len(sizes)
+    if rotate:
+        rotated = sizes[:, 1] > sizes[:, 0]
+        sizes = np.where(rotated[:, np.newaxis], sizes[:, ::-1], sizes)
+    else:
+        rotated = np.zeros(num, dtype=np.bool_)
+    if num == 0:
+        return PackResult(np.zeros((0, 2)), rotated, sizes, 1.0, 0.0)
+
+    def pack(padded):
+        # try some bin widths, and choose the most square one
+        area = np.sum(padded[:, 0] * padded[:, 1])
+        min_width = padded[:, 0].max()
+        best = None
+        for r in BIN_WIDTH_RATIOS:
+            bin_width = max(np.sqrt(area) * r, min_width)
+            pos, w, h = pack_shelves(padded, bin_width)
+            if best is None or max(w, h) < best[1]:
+                best = (pos, max(w, h))
+            # wider bin never makes packed region more square
+            if w >= h:
+                break
+        return best
+
+    positions, side = pack(sizes)
+    if margin > 0.0:
+        # margin is given in packed space whose scale depends on packed size
+        # itself, so refine margin a few times
+        m = 0.0
+        for _ in range(3):
+            m = margin * side
+            positions, side = pack(sizes + m)
+        positions = positions + m * 0.5
+
+    scale = 1.0 / side if side > 0.0 else 1.0
+    utilization = np.sum(sizes[:, 0] * sizes[:, 1]) * scale * scale
+
+    return PackResult(positions, rotated, sizes, scale, utilization)
+
+
+def transform_uvs(uvs, labels, mins, result):
+    """
+    Transform UV coordinates of islands to packed location
+    uvs: (N, 2) array of UV coordinates
+    labels: (N, ) array of island index which UV belongs to
+    mins: (I, 2) array of minimum UV coordinates of islands
+    result: PackResult of islands
+    """
+
+    local = uvs - mins[labels]
+    rotated = result.rotated[labels]
+    # rotate by 90 degree (counterclockwise) and move to positive region
+    # width of rotated island equals to its height before rotated
+    rot = np.stack((result.sizes[labels, 0] - local[:, 1], local[:, 0]),
+                   axis=1)
+    local = np.where(rotated[:, np.newaxis], rot, local)
+
+    return (local + result.positions[labels]) * result.scale
@@ -23,8 +23,11 @@ __status__ = "production"
 __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
-from math import fabs
+from collections import defaultdict, Counter, OrderedDict
+from itertools import product
+from math import fabs, floor, atan2, cos, sin
 
+import numpy as np
 import bpy
 import bmesh
 import mathutils
@@ -32,10 +35,166 @@ from bpy.props import (
     FloatProperty,
     FloatVectorProperty,
     BoolProperty,
+    EnumProperty,
 )
 from mathutils import Vector
 
 from . import muv_common
+from . import muv_packer
+
+
+def get_island_shape(uv_layer, isl):
+    """
+    Get shape of island used to match islands regardless of location,
+    rotation and mirror
+    """
+
+    faces = [f['face'] for f in isl['faces']]
+    face_sizes = [len(f.loops) for f in faces]
+    uvs = muv_common.get_loop_uv_array(
+        [l for f in faces for l in f.loops], uv_layer)
+    center = uvs.mean(axis=0)
+    face_uvs = np.array(
+        [f['ave_uv'][:] for f in isl['faces']], dtype=np.float64)
+
+    # square root of eigenvalues of covariance matrix are invariant under
+    # rotation and mirror
+    rel_uvs = uvs - center
+    cov = rel_uvs.T.dot(rel_uvs) / len(rel_uvs)
+    extents = np.sqrt(np.maximum(np.linalg.eigvalsh(cov), 0.0))
+
+    return {
+        'rel_uvs': rel_uvs,
+        'rel_face_uvs': face_uvs - center,
+        'face_offsets': np.cumsum([0] + face_sizes[:-1]),
+        'face_sizes': face_sizes,
+        'topology': (len(faces), len(uvs),
+                     tuple(sorted(Counter(face_sizes).items()))),
+        'extents': extents,
+    }
+
+
+def get_shape_transforms(shape_1, shape_2, tol):
+    """
+    Get candidates of transform (rotation and mirror) which maps shape_2
+    onto shape_1
+    Transform is decided by mapping the farthest UV from center of shape_1
+    to UV of shape_2 which has same distance from center
+    """
+
+    dist_1 = np.linalg.norm(shape_1['rel_uvs'], axis=1)
+    dist_2 = np.linalg.norm(shape_2['rel_uvs'], axis=1)
+    anchor = shape_1['rel_uvs'][np.argmax(dist_1)]
+    if dist_1.max() < tol:
+        return [np.identity(2)]
+    # UVs of same vertex are integrated
+    cands = {}
+    for c in shape_2['rel_uvs'][np.abs(dist_2 - dist_1.max()) < tol]:
+        cands.setdefault((int(round(c[0] / tol)), int(round(c[1] / tol))), c)
+    if not cands:
+        return []
+    cands = np.array([cands[k] for k in sorted(cands.keys())])
+
+    transforms = []
+    angle_1 = atan2(anchor[1], anchor[0])
+    for mirror in (np.identity(2), np.array([[1.0, 0.0], [0.0, -1.0]])):
+        for c in cands.dot(mirror.T):
+            theta = angle_1 - atan2(c[1], c[0])
+            rot = np.array([[cos(theta), -sin(theta)],
+                            [sin(theta), cos(theta)]])
+            transforms.append(rot.dot(mirror))
+
+    return transforms
+
+
+def get_loop_uvs(loops, uv_layers):
+    """
+    Get UV coordinates of loops (UV layer is specified per loop)
+    """
+
+    return np.array(
+        [l[layer].uv[:] for l, layer in zip(loops, uv_layers)],
+        dtype=np.float64).reshape(-1, 2)
+
+
+def set_loop_uvs(loops, uv_layers, uvs):
+    """
+    Set UV coordinates of loops (UV layer is specified per loop)
+    """
+
+    for l, layer, uv in zip(loops, uv_layers, uvs.tolist()):
+        l[layer].uv = uv
+
+
+def get_face_keys(isl, quantum):
+    """
+    Get quantized face centers relative to island center and the order
+    which sorts them
+    """
+
+    face_uvs = np.array(
+        [f['ave_uv'][:] for f in isl['faces']], dtype=np.float64)
+    center = np.array(isl['center'][:], dtype=np.float64)
+    keys = np.floor((face_uvs - center) / quantum + 0.5).astype(np.int64)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+
+    return keys[order], order
+
+
+class MUV_PackUVGroupCache():
+    """
+    Custom class: Cache grouped islands and correspondence of their faces
+    Islands and faces are stored as indices because BMesh data is
+    invalidated by undo/redo
+    """
+
+    def __init__(self, profile):
+        self.__key = None
+        self.__groups = None
+        self.__counters = OrderedDict([("Hit", 0), ("Miss", 0)])
+        profile.counters["Pack UV Group Cache"] = self.__counters
+
+    def get(self, key, island_info):
+        """
+        Restore groups from cache
+        Return None if cached groups are not available
+        """
+
+        if key != self.__key:
+            self.__counters["Miss"] += 1
+            return None
+        self.__counters["Hit"] += 1
+
+        groups = []
+        for gidx, entries in enumerate(self.__groups):
+            group = []
+            for isl_idx, order, loop_map in entries:
+                isl = island_info[isl_idx]
+                isl['group'] = gidx
+                isl['sorted'] = [isl['faces'][k] for k in order]
+                if loop_map is not None:
+                    isl['loop_map'] = loop_map
+                group.append(isl)
+            groups.append(group)
+
+        return groups
+
+    def store(self, key, island_info, groups):
+        """
+        Store groups to cache
+        """
+
+        isl_index = {id(isl): i for i, isl in enumerate(island_info)}
+        self.__groups = []
+        for group in groups:
+            entries = []
+            for isl in group:
+                face_index = {id(f): k for k, f in enumerate(isl['faces'])}
+                order = [face_index[id(f)] for f in isl['sorted']]
+                entries.append(
+                    (isl_index[id(isl)], order, isl.get('loop_map')))
+            self.__groups.append(entries)
+        self.__key = key
 
 
 class MUV_PackUV(bpy.types.Operator):
@@ -45,6 +204,10 @@ class MUV_PackUV(bpy.types.Operator):
      - Same center of UV island
      - Same size of UV island
      - Same number of UV
+    Island matching algorithm (Match Rotated/Mirrored)
+     - Same topology of UV island
+     - Same extents of UV island along its principal axes
+     - Same shape after rotated/mirrored
     """
 
     bl_idname = "uv.muv_packuv"
@@ -54,11 +217,11 @@ class MUV_PackUV(bpy.types.Operator):
 
     rotate = BoolProperty(
         name="Rotate",
-        description="Rotate option used by default pack UV function",
+        description="Rotate option used by pack UV function",
         default=False)
     margin = FloatProperty(
         name="Margin",
-        description="Margin used by default pack UV function",
+        description="Margin used by pack UV function",
         min=0,
         max=1,
         default=0.001)
@@ -76,126 +239,429 @@ class MUV_PackUV(bpy.types.Operator):
         max=0.1,
         default=(0.001, 0.001),
         size=2)
+    engine = EnumProperty(
+        name="Engine",
+        description="Packing engine",
+        items=[
+            ('BLENDER', "Blender", "Pack by Blender's pack islands function"),
+            ('NATIVE', "Built-in",
+             "Pack by deterministic built-in packer (Shelf packing)")
+        ],
+        default='BLENDER')
+    multi_object = BoolProperty(
+        name="Selected Objects",
+        description="Pack UV islands of all selected mesh objects into "
+                    "shared UV space by built-in packer "
+                    "(All faces are packed in objects not in edit mode)",
+        default=False)
+    match_transformed = BoolProperty(
+        name="Match Rotated/Mirrored",
+        description="Integrate same UV islands even if they are rotated, "
+                    "mirrored or placed at different location",
+        default=False)
 
-    def execute(self, _):
-        obj = bpy.context.active_object
-        bm = bmesh.from_edit_mesh(obj.data)
-        if muv_common.check_version(2, 73, 0) >= 0:
-            bm.faces.ensure_lookup_table()
-        if not bm.loops.layers.uv:
-            self.report({'WARNING'}, "Object must have more than one UV map")
-            return {'CANCELLED'}
-        uv_layer = bm.loops.layers.uv.verify()
+    def execute(self, context):
+        obj = context.active_object
+        timer = muv_common.PhaseTimer(
+            context.scene.muv_props.profile, "Pack UV")
 
-        selected_faces = [f for f in bm.faces if f.select]
-        island_info = muv_common.get_island_info(obj)
-        num_group = self.__group_island(island_info)
+        if self.multi_object:
+            objs = muv_common.get_selected_mesh_objects(context)
+        else:
+            objs = [obj]
+
+        # collect islands of all objects
+        targets = []
+        island_info = []
+        for o in objs:
+            bm = muv_common.get_object_bmesh(o)
+            if not bm.loops.layers.uv:
+                if o == obj:
+                    self.report(
+                        {'WARNING'}, "Object must have more than one UV map")
+                    return {'CANCELLED'}
+                if not o.data.is_editmode:
+                    bm.free()
+                continue
+            uv_layer = bm.loops.layers.uv.verify()
+            info = muv_common.get_island_info_from_bmesh(
+                bm, o.data.is_editmode)
+            for isl in info:
+                isl['uv_layer'] = uv_layer
+            island_info.extend(info)
+            targets.append((o, bm))
 
-        loop_lists = [l for f in bm.faces for l in f.loops]
-        bpy.ops.mesh.select_all(action='DESELECT')
+        bm = targets[0][1]
+        selected_faces = [f for f in bm.faces if f.select]
+        props = context.scene.muv_props.packuv
+        if props.group_cache is None:
+            props.group_cache = MUV_PackUVGroupCache(
+                context.scene.muv_props.profile)
+        key = self.__get_group_key(targets, island_info)
+        groups = props.group_cache.get(key, island_info)
+        if groups is None:
+            if self.match_transformed:
+                groups = self.__group_island_by_shape(island_info)
+            else:
+                groups = self.__group_island(island_info)
+            props.group_cache.store(key, island_info, groups)
+        src_loops, dst_loops, dst_to_src = self.__get_loop_mapping(groups)
+        timer.lap("Group")
+        timer.count("Objects", len(targets))
+        timer.count("Islands", len(island_info))
+        timer.count("Groups", len(groups))
 
         # pack UV
-        for gidx in range(num_group):
-            group = list(filter(
-                lambda i, idx=gidx: i['group'] == idx, island_info))
-            for f in group[0]['faces']:
-                f['face'].select = True
-        bmesh.update_edit_mesh(obj.data)
-        bpy.ops.uv.select_all(action='SELECT')
-        bpy.ops.uv.pack_islands(rotate=self.rotate, margin=self.margin)
+        # islands among objects can be packed only by built-in packer
+        use_native = self.engine == 'NATIVE' or self.multi_object
+        if use_native:
+            utilization = self.__pack_native(groups)
+            self.report(
+                {'INFO'}, "Utilization: {0:.1f} %".format(utilization * 100.0))
+        else:
+            bpy.ops.mesh.select_all(action='DESELECT')
+            for group in groups:
+                for f in group[0]['faces']:
+                    f['face'].select = True
+            bmesh.update_edit_mesh(obj.data)
+            bpy.ops.uv.select_all(action='SELECT')
+            bpy.ops.uv.pack_islands(rotate=self.rotate, margin=self.margin)
+        timer.lap("Pack")
 
         # copy/paste UV among same islands
-        for gidx in range(num_group):
-            group = list(filter(
-                lambda i, idx=gidx: i['group'] == idx, island_info))
-            if len(group) <= 1:
-                continue
-            for g in group[1:]:
-                for (src_face, dest_face) in zip(
-                        group[0]['sorted'], g['sorted']):
-                    for (src_loop, dest_loop) in zip(
-                            src_face['face'].loops, dest_face['face'].loops):
-                        loop_lists[dest_loop.index][uv_layer].uv = loop_lists[
-                            src_loop.index][uv_layer].uv
+        src_uvs = get_loop_uvs(*src_loops)
+        set_loop_uvs(dst_loops[0], dst_loops[1], src_uvs[dst_to_src])
+        timer.lap("Copy")
 
         # restore face/UV selection
-        bpy.ops.uv.select_all(action='DESELECT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        for f in selected_faces:
-            f.select = True
-        bpy.ops.uv.select_all(action='SELECT')
+        if not use_native:
+            bpy.ops.uv.select_all(action='DESELECT')
+            bpy.ops.mesh.select_all(action='DESELECT')
+            for f in selected_faces:
+                f.select = True
+            bpy.ops.uv.select_all(action='SELECT')
 
-        bmesh.update_edit_mesh(obj.data)
+        for o, bm in targets:
+            muv_common.update_object_bmesh(o, bm)
+        timer.lap("Write Back")
 
         return {'FINISHED'}
 
-    def __sort_island_faces(self, kd, uvs, isl1, isl2):
+    def __get_group_key(self, targets, island_info):
         """
-        Sort faces in island
+        Get key of cached groups
+        Groups are reusable while faces and UVs of islands and grouping
+        options are not changed
         """
 
+        loops = []
+        layers = []
+        faces = []
+        for isl in island_info:
+            isl_faces = [f['face'] for f in isl['faces']]
+            faces.append(tuple(f.index for f in isl_faces))
+            isl_loops = [l for f in isl_faces for l in f.loops]
+            loops.extend(isl_loops)
+            layers.extend([isl['uv_layer']] * len(isl_loops))
+        uvs = get_loop_uvs(loops, layers)
+
+        return (
+            tuple((o.name, len(bm.faces)) for o, bm in targets),
+            tuple(faces),
+            hash(uvs.tobytes()),
+            tuple(self.allowable_center_deviation),
+            tuple(self.allowable_size_deviation),
+            self.match_transformed
+        )
+
+    def __pack_native(self, groups):
+        """
+        Pack first island of each group by built-in packer
+        Return utilization of UV space
+        """
+
+        islands = [group[0] for group in groups]
+        mins, maxs = muv_common.get_island_bounds(islands)
+        result = muv_packer.pack_rects(maxs - mins, self.margin, self.rotate)
+
+        loops = []
+        layers = []
+        labels = []
+        for i, isl in enumerate(islands):
+            isl_loops = [l for f in isl['faces'] for l in f['face'].loops]
+            loops.extend(isl_loops)
+            layers.extend([isl['uv_layer']] * len(isl_loops))
+            labels.extend([i] * len(isl_loops))
+        uvs = get_loop_uvs(loops, layers)
+        set_loop_uvs(loops, layers, muv_packer.transform_uvs(
+            uvs, np.array(labels, dtype=np.int64), mins, result))
+
+        return result.utilization
+
+    def __get_loop_mapping(self, groups):
+        """
+        Get loops of grouped islands to copy/paste UV
+        Return loops (and UV layers) of source islands, loops (and UV layers)
+        of destination islands and index of source loop for each destination
+        loop
+        """
+
+        src_loops = []
+        src_layers = []
+        dst_loops = []
+        dst_layers = []
+        dst_to_src = []
+        for group in groups:
+            if len(group) <= 1:
+                continue
+            src_faces = [f['face'] for f in group[0]['sorted']]
+            offsets = []
+            for f in src_faces:
+                offsets.append(len(src_loops))
+                src_loops.extend(f.loops)
+            src_layers.extend(
+                [group[0]['uv_layer']] * (len(src_loops) - len(src_layers)))
+            for isl in group[1:]:
+                if 'loop_map' in isl:
+                    for offset, dst_face, loop_map in zip(
+                            offsets, isl['sorted'], isl['loop_map']):
+                        dst_loops.extend(dst_face['face'].loops)
+                        dst_to_src.extend(offset + i for i in loop_map)
+                else:
+                    for offset, src_face, dst_face in zip(
+                            offsets, src_faces, isl['sorted']):
+                        dst_face_loops = dst_face['face'].loops
+                        num = min(len(src_face.loops), len(dst_face_loops))
+                        dst_loops.extend(dst_face_loops[:num])
+                        dst_to_src.extend(range(offset, offset + num))
+                dst_layers.extend(
+                    [isl['uv_layer']] * (len(dst_loops) - len(dst_layers)))
+
+        return ((src_loops, src_layers), (dst_loops, dst_layers),
+                np.array(dst_to_src, dtype=np.int64))
+
+    def __align_island(self, kd, isl_1, isl_2, tol):
+        """
+        Find transform which maps isl_2 onto isl_1, and sort faces and
+        loops of isl_2 in order of isl_1
+        Return False if islands are not same
+        """
+
+        shape_1 = isl_1['shape']
+        shape_2 = isl_2['shape']
+        num_faces = len(isl_2['faces'])
+
+        for mat in get_shape_transforms(shape_1, shape_2, tol):
+            # find corresponding face by transformed face center
+            face_uvs = shape_2['rel_face_uvs'].dot(mat.T)
+            sorted_faces = [None] * num_faces
+            loop_map = [None] * num_faces
+            for fidx, fuv in enumerate(face_uvs):
+                _, idx, dist = kd.find((fuv[0], fuv[1], 0.0))
+                if dist > tol or sorted_faces[idx] is not None:
+                    break
+                if shape_1['face_sizes'][idx] != \
+                        shape_2['face_sizes'][fidx]:
+                    break
+
+                # find corresponding loop by transformed UV
+                num = shape_2['face_sizes'][fidx]
+                o1 = shape_1['face_offsets'][idx]
+                o2 = shape_2['face_offsets'][fidx]
+                uvs_1 = shape_1['rel_uvs'][o1:o1 + num]
+                uvs_2 = shape_2['rel_uvs'][o2:o2 + num].dot(mat.T)
+                d = np.linalg.norm(
+                    uvs_2[:, np.newaxis, :] - uvs_1[np.newaxis, :, :], axis=2)
+                lmap = np.argmin(d, axis=1)
+                if d[np.arange(num), lmap].max() > tol or \
+                        len(set(lmap.tolist())) != num:
+                    break
+
+                sorted_faces[idx] = isl_2['faces'][fidx]
+                loop_map[idx] = lmap.tolist()
+            else:
+                isl_2['sorted'] = sorted_faces
+                isl_2['loop_map'] = loop_map
+                return True
+
+        return False
+
+    def __group_island_by_shape(self, island_info):
+        """
+        Group island regardless of location, rotation and mirror
+        Islands are hashed by topology and extents, and islands in same or
+        neighbouring cells are compared by their aligned shapes
+        """
+
+        tol = max(self.allowable_size_deviation)
+
+        # register islands to hash
+        cells = []
+        buckets = defaultdict(list)
+        for i, isl in enumerate(island_info):
+            isl['shape'] = get_island_shape(isl['uv_layer'], isl)
+            ext = isl['shape']['extents']
+            c = (isl['shape']['topology'],
+                 int(floor(ext[0] / tol)), int(floor(ext[1] / tol)))
+            cells.append(c)
+            buckets[c].append(i)
+
+        groups = []
+        for i, isl_1 in enumerate(island_info):
+            if isl_1['group'] != -1:
+                continue
+            num_group = len(groups)
+            isl_1['group'] = num_group
+            isl_1['sorted'] = isl_1['faces']
+            group = [isl_1]
+            groups.append(group)
+
+            # collect islands in same or neighbouring cells
+            c = cells[i]
+            candidates = []
+            for d in product((-1, 0, 1), repeat=2):
+                key = (c[0], c[1] + d[0], c[2] + d[1])
+                if key not in buckets:
+                    continue
+                bucket = [j for j in buckets[key]
+                          if island_info[j]['group'] == -1]
+                buckets[key] = bucket
+                candidates.extend(bucket)
+            if not candidates:
+                continue
+
+            rel_face_uvs = isl_1['shape']['rel_face_uvs']
+            kd = mathutils.kdtree.KDTree(len(rel_face_uvs))
+            for fidx, fuv in enumerate(rel_face_uvs):
+                kd.insert((fuv[0], fuv[1], 0.0), fidx)
+            kd.balance()
+
+            for j in sorted(candidates):
+                isl_2 = island_info[j]
+                if self.__align_island(kd, isl_1, isl_2, tol):
+                    isl_2['group'] = num_group
+                    group.append(isl_2)
+
+        return groups
+
+    def __sort_island_faces(self, leader_keys, isl1, isl2):
+        """
+        Sort faces in island so that they correspond to faces of first
+        island in group
+        Faces are matched by sorting their quantized relative centers, and
+        nearest face is searched only if the sorted centers are not same
+        """
+
+        keys, order = get_face_keys(isl2, self.__get_face_quantum())
+        sorted_keys, leader_order = leader_keys
+        if np.array_equal(keys, sorted_keys) and \
+                not np.any(np.all(keys[1:] == keys[:-1], axis=1)):
+            sorted_faces = [None] * len(order)
+            for i, j in zip(leader_order.tolist(), order.tolist()):
+                sorted_faces[i] = isl2['faces'][j]
+            return sorted_faces
+
+        kd = mathutils.kdtree.KDTree(len(isl2['faces']))
+        for fidx, f in enumerate(isl2['faces']):
+            kd.insert(Vector((f['ave_uv'].x, f['ave_uv'].y, 0.0)), fidx)
+        kd.balance()
         sorted_faces = []
         for f in isl1['sorted']:
             _, idx, _ = kd.find(
                 Vector((f['ave_uv'].x, f['ave_uv'].y, 0.0)))
-            sorted_faces.append(isl2['faces'][uvs[idx]['face_idx']])
+            sorted_faces.append(isl2['faces'][idx])
         return sorted_faces
 
+    def __get_face_quantum(self):
+        """
+        Get quantum of face centers to match faces among same islands
+        """
+
+        return min(min(self.allowable_size_deviation), 0.001) * 0.1
+
+    def __get_island_cell(self, isl):
+        """
+        Get cell of spatial hash which island belongs to
+        Cell size is same as allowable deviation, so same islands are
+        always found in neighbouring cells
+        """
+
+        return (
+            int(floor(isl['center'].x / self.allowable_center_deviation[0])),
+            int(floor(isl['center'].y / self.allowable_center_deviation[1])),
+            int(floor(isl['size'].x / self.allowable_size_deviation[0])),
+            int(floor(isl['size'].y / self.allowable_size_deviation[1])),
+            isl['num_uv']
+        )
+
     def __group_island(self, island_info):
         """
         Group island
+        Return list of groups, and first island of each group is the one
+        to be packed
         """
 
-        num_group = 0
-        while True:
+        # register islands to spatial hash
+        cells = [self.__get_island_cell(isl) for isl in island_info]
+        buckets = defaultdict(list)
+        for i, c in enumerate(cells):
+            buckets[c].append(i)
+        neighbours = list(product((-1, 0, 1), repeat=4))
+
+        groups = []
+        for i, isl_1 in enumerate(island_info):
             # search islands which is not parsed yet
-            isl_1 = None
-            for isl_1 in island_info:
-                if isl_1['group'] == -1:
-                    break
-            else:
-                break   # all faces are parsed
-            if isl_1 is None:
-                break
+            if isl_1['group'] != -1:
+                continue
+            num_group = len(groups)
             isl_1['group'] = num_group
             isl_1['sorted'] = isl_1['faces']
+            group = [isl_1]
+            groups.append(group)
+
+            # collect islands in neighbouring cells
+            c = cells[i]
+            candidates = []
+            for d in neighbours:
+                key = (c[0] + d[0], c[1] + d[1], c[2] + d[2], c[3] + d[3],
+                       c[4])
+                if key not in buckets:
+                    continue
+                bucket = [j for j in buckets[key]
+                          if island_info[j]['group'] == -1]
+                buckets[key] = bucket
+                candidates.extend(bucket)
 
             # search same island
-            for isl_2 in island_info:
-                if isl_2['group'] == -1:
-                    dcx = isl_2['center'].x - isl_1['center'].x
-                    dcy = isl_2['center'].y - isl_1['center'].y
-                    dsx = isl_2['size'].x - isl_1['size'].x
-                    dsy = isl_2['size'].y - isl_1['size'].y
-                    center_x_matched = (
-                        fabs(dcx) < self.allowable_center_deviation[0])
-                    center_y_matched = (
-                        fabs(dcy) < self.allowable_center_deviation[1])
-                    size_x_matched = (
-                        fabs(dsx) < self.allowable_size_deviation[0])
-                    size_y_matched = (
-                        fabs(dsy) < self.allowable_size_deviation[1])
-                    center_matched = center_x_matched and center_y_matched
-                    size_matched = size_x_matched and size_y_matched
-                    num_uv_matched = (isl_2['num_uv'] == isl_1['num_uv'])
-                    # are islands have same?
-                    if center_matched and size_matched and num_uv_matched:
-                        isl_2['group'] = num_group
-                        kd = mathutils.kdtree.KDTree(len(isl_2['faces']))
-                        uvs = [
-                            {
-                                'uv': Vector(
-                                    (f['ave_uv'].x, f['ave_uv'].y, 0.0)
-                                ),
-                                'face_idx': fidx
-                            } for fidx, f in enumerate(isl_2['faces'])
-                        ]
-                        for i, uv in enumerate(uvs):
-                            kd.insert(uv['uv'], i)
-                        kd.balance()
-                        # sort faces for copy/paste UV
-                        isl_2['sorted'] = self.__sort_island_faces(
-                            kd, uvs, isl_1, isl_2)
-            num_group = num_group + 1
-
-        return num_group
+            leader_keys = None
+            for j in sorted(candidates):
+                isl_2 = island_info[j]
+                dcx = isl_2['center'].x - isl_1['center'].x
+                dcy = isl_2['center'].y - isl_1['center'].y
+                dsx = isl_2['size'].x - isl_1['size'].x
+                dsy = isl_2['size'].y - isl_1['size'].y
+                center_x_matched = (
+                    fabs(dcx) < self.allowable_center_deviation[0])
+                center_y_matched = (
+                    fabs(dcy) < self.allowable_center_deviation[1])
+                size_x_matched = (
+                    fabs(dsx) < self.allowable_size_deviation[0])
+                size_y_matched = (
+                    fabs(dsy) < self.allowable_size_deviation[1])
+                center_matched = center_x_matched and center_y_matched
+                size_matched = size_x_matched and size_y_matched
+                num_uv_matched = (isl_2['num_uv'] == isl_1['num_uv'])
+                # are islands have same?
+                if center_matched and size_matched and num_uv_matched:
+                    isl_2['group'] = num_group
+                    group.append(isl_2)
+                    # sorted face centers of first island are shared by
+                    # all islands in group
+                    if leader_keys is None:
+                        leader_keys = get_face_keys(
+                            isl_1, self.__get_face_quantum())
+                    # sort faces for copy/paste UV
+                    isl_2['sorted'] = self.__sort_island_faces(
+                        leader_keys, isl_1, isl_2)
+
+        return groups
@@ -46,6 +46,10 @@ class MUV_Preferences(AddonPreferences):
     enable_auvc = BoolProperty(
         name="Align UV Cursor",
         default=True)
+    enable_profile = BoolProperty(
+        name="Profiling",
+        description="Show processing time of features on Property Panel",
+        default=False)
 
     # for Texture Projection
     texproj_canvas_padding = FloatVectorProperty(
@@ -95,6 +99,7 @@ class MUV_Preferences(AddonPreferences):
             col.prop(self, "uvbb_cp_react_size")
 
         layout.prop(self, "enable_auvc")
+        layout.prop(self, "enable_profile")
 
         layout.label("Description:")
         column = layout.column(align=True)
@@ -142,6 +147,7 @@ class MUV_Preferences(AddonPreferences):
         sp = sp.split(percentage=1.0)
         col = sp.column(align=True)
         col.label("Texture Projection")
+        col.label("Profiling")
 
         row = layout.row(align=True)
         sp = row.split(percentage=0.3)
@@ -23,10 +23,9 @@ __status__ = "production"
 __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
+import numpy as np
 import bpy
-import bmesh
-from bpy.props import StringProperty, EnumProperty
-from mathutils import Vector
+from bpy.props import StringProperty, EnumProperty, BoolProperty
 from . import muv_common
 
 
@@ -58,6 +57,12 @@ class MUV_PreserveUVAspect(bpy.types.Operator):
         ],
         default="CENTER"
     )
+    multi_object = BoolProperty(
+        name="Selected Objects",
+        description="Apply to all selected mesh objects "
+                    "(All faces are processed in objects not in edit mode)",
+        default=False
+    )
 
     @classmethod
     def poll(cls, context):
@@ -69,137 +74,75 @@ class MUV_PreserveUVAspect(bpy.types.Operator):
         # f[tex_layer].image doesn't return None
         # which will happen in certain cases
         obj = context.active_object
-        bm = bmesh.from_edit_mesh(obj.data)
-
-        if muv_common.check_version(2, 73, 0) >= 0:
-            bm.faces.ensure_lookup_table()
-
-        if not bm.loops.layers.uv:
-            self.report({'WARNING'}, "Object must have more than one UV map")
-            return {'CANCELLED'}
-
-        uv_layer = bm.loops.layers.uv.verify()
-        tex_layer = bm.faces.layers.tex.verify()
-
-        sel_faces = [f for f in bm.faces if f.select]
         dest_img = bpy.data.images[self.dest_img_name]
+        if 0 in dest_img.size[:]:
+            self.report({'WARNING'}, "Image size must not be zero")
+            return {'CANCELLED'}
 
-        info = {}
-
-        for f in sel_faces:
-            if not f[tex_layer].image in info.keys():
-                info[f[tex_layer].image] = {}
-                info[f[tex_layer].image]['faces'] = []
-            info[f[tex_layer].image]['faces'].append(f)
-
-        for img in info:
-            if img is None:
-                continue
-
-            src_img = img
-            ratio = Vector((
-                dest_img.size[0] / src_img.size[0],
-                dest_img.size[1] / src_img.size[1]))
-
-            if self.origin == 'CENTER':
-                origin = Vector((0.0, 0.0))
-                num = 0
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin = origin + uv
-                        num = num + 1
-                origin = origin / num
-            elif self.origin == 'LEFT_TOP':
-                origin = Vector((100000.0, -100000.0))
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = min(origin.x, uv.x)
-                        origin.y = max(origin.y, uv.y)
-            elif self.origin == 'LEFT_CENTER':
-                origin = Vector((100000.0, 0.0))
-                num = 0
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = min(origin.x, uv.x)
-                        origin.y = origin.y + uv.y
-                        num = num + 1
-                origin.y = origin.y / num
-            elif self.origin == 'LEFT_BOTTOM':
-                origin = Vector((100000.0, 100000.0))
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = min(origin.x, uv.x)
-                        origin.y = min(origin.y, uv.y)
-            elif self.origin == 'CENTER_TOP':
-                origin = Vector((0.0, -100000.0))
-                num = 0
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = origin.x + uv.x
-                        origin.y = max(origin.y, uv.y)
-                        num = num + 1
-                origin.x = origin.x / num
-            elif self.origin == 'CENTER_BOTTOM':
-                origin = Vector((0.0, 100000.0))
-                num = 0
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = origin.x + uv.x
-                        origin.y = min(origin.y, uv.y)
-                        num = num + 1
-                origin.x = origin.x / num
-            elif self.origin == 'RIGHT_TOP':
-                origin = Vector((-100000.0, -100000.0))
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = max(origin.x, uv.x)
-                        origin.y = max(origin.y, uv.y)
-            elif self.origin == 'RIGHT_CENTER':
-                origin = Vector((-100000.0, 0.0))
-                num = 0
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = max(origin.x, uv.x)
-                        origin.y = origin.y + uv.y
-                        num = num + 1
-                origin.y = origin.y / num
-            elif self.origin == 'RIGHT_BOTTOM':
-                origin = Vector((-100000.0, 100000.0))
-                for f in info[img]['faces']:
-                    for l in f.loops:
-                        uv = l[uv_layer].uv
-                        origin.x = max(origin.x, uv.x)
-                        origin.y = min(origin.y, uv.y)
-
-            info[img]['ratio'] = ratio
-            info[img]['origin'] = origin
-
-        for img in info:
-            if img is None:
+        if self.multi_object:
+            objs = muv_common.get_selected_mesh_objects(context)
+        else:
+            objs = [obj]
+
+        # collect faces of all objects, and index of image for each face
+        targets = []
+        images = []
+        img_index = {}
+        faces = []
+        labels = []
+        for o in objs:
+            bm = muv_common.get_object_bmesh(o)
+            if not bm.loops.layers.uv:
+                if o == obj:
+                    self.report(
+                        {'WARNING'}, "Object must have more than one UV map")
+                    return {'CANCELLED'}
+                if not o.data.is_editmode:
+                    bm.free()
                 continue
-
-            for f in info[img]['faces']:
+            uv_layer = bm.loops.layers.uv.verify()
+            tex_layer = bm.faces.layers.tex.verify()
+
+            num_faces = len(faces)
+            for f in muv_common.get_object_target_faces(o, bm):
+                img = f[tex_layer].image
+                # UV can not be scaled for image whose file is missing
+                if img is None or 0 in img.size[:]:
+                    continue
+                if img not in img_index:
+                    img_index[img] = len(images)
+                    images.append(img)
+                faces.append(f)
+                labels.append(img_index[img])
+            targets.append((o, bm, uv_layer, tex_layer, num_faces, len(faces)))
+
+        sizes = np.array(
+            [img.size[:] for img in images], dtype=np.float64).reshape(-1, 2)
+        ratios = np.array(dest_img.size[:], dtype=np.float64) / sizes
+
+        # scale UV about origin of each image group
+        loops = [[l for f in faces[first:last] for l in f.loops]
+                 for _, _, _, _, first, last in targets]
+        loop_labels = np.repeat(
+            np.array(labels, dtype=np.int64), [len(f.loops) for f in faces])
+        uvs = np.concatenate(
+            [muv_common.get_loop_uv_array(obj_loops, t[2])
+             for obj_loops, t in zip(loops, targets)])
+        origins = muv_common.get_uv_anchors(
+            uvs, loop_labels, len(images))[self.origin]
+        uvs = muv_common.scale_uv_groups(
+            uvs, loop_labels, origins, 1.0 / ratios)
+
+        # write back to each object
+        offset = 0
+        for obj_loops, t in zip(loops, targets):
+            o, bm, uv_layer, tex_layer, first, last = t
+            muv_common.set_loop_uv_array(
+                obj_loops, uv_layer, uvs[offset:offset + len(obj_loops)])
+            offset += len(obj_loops)
+            for f in faces[first:last]:
                 f[tex_layer].image = dest_img
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin = info[img]['origin']
-                    ratio = info[img]['ratio']
-                    diff = uv - origin
-                    diff.x = diff.x / ratio.x
-                    diff.y = diff.y / ratio.y
-                    uv.x = origin.x + diff.x
-                    uv.y = origin.y + diff.y
-                    l[uv_layer].uv = uv
-
-        bmesh.update_edit_mesh(obj.data)
+            muv_common.update_object_bmesh(o, bm)
 
         return {'FINISHED'}
 
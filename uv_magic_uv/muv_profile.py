@@ -0,0 +1,92 @@
+# <pep8-80 compliant>
+
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+__author__ = "Nutti <nutti.metro@gmail.com>"
+__status__ = "production"
+__version__ = "4.5"
+__date__ = "19 Nov 2017"
+
+import bpy
+
+
+class MUV_ProfileClear(bpy.types.Operator):
+    """
+    Operation class: Clear profiling result
+    """
+
+    bl_idname = "uv.muv_profile_clear"
+    bl_label = "Clear"
+    bl_description = "Clear profiling result"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        profile = context.scene.muv_props.profile
+        profile.timings.clear()
+        for counters in profile.counters.values():
+            for c in counters:
+                counters[c] = 0
+
+        return {'FINISHED'}
+
+
+class VIEW3D_PT_MUV_Profile(bpy.types.Panel):
+    """
+    Panel class: Profiling result on Property Panel on View3D
+    """
+
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_label = "Magic UV Profile"
+
+    @classmethod
+    def poll(cls, context):
+        prefs = context.user_preferences.addons["uv_magic_uv"].preferences
+        return prefs.enable_profile
+
+    def draw_header(self, _):
+        layout = self.layout
+        layout.label(text="", icon='IMAGE_COL')
+
+    def draw(self, context):
+        layout = self.layout
+        profile = context.scene.muv_props.profile
+
+        names = sorted(set(profile.timings.keys()) |
+                       set(profile.counters.keys()))
+        if not names:
+            layout.label("No profiling result")
+            return
+
+        for name in names:
+            box = layout.box()
+            box.label(name)
+            col = box.column(align=True)
+            for phase, t in profile.timings.get(name, {}).items():
+                col.label("{0}: {1:.3f} ms".format(phase, t * 1000.0))
+            counters = profile.counters.get(name, {})
+            for c, v in counters.items():
+                col.label("{0}: {1}".format(c, v))
+            if "Hit" in counters and "Miss" in counters:
+                total = counters["Hit"] + counters["Miss"]
+                if total > 0:
+                    col.label("Hit Rate: {0:.1f} %".format(
+                        counters["Hit"] * 100.0 / total))
+
+        layout.operator(MUV_ProfileClear.bl_idname)
@@ -53,6 +53,10 @@ class MUV_Properties():
     texlock = None
     texwrap = None
     wsuv = None
+    packuv = None
+    mirroruv = None
+    uvw = None
+    profile = None
 
     def __init__(self):
         self.cpuv = MUV_CPUVProps()
@@ -64,6 +68,10 @@ class MUV_Properties():
         self.texlock = MUV_TexLockProps()
         self.texwrap = MUV_TexWrapProps()
         self.wsuv = MUV_WSUVProps()
+        self.packuv = MUV_PackUVProps()
+        self.mirroruv = MUV_MirrorUVProps()
+        self.uvw = MUV_UVWProps()
+        self.profile = MUV_ProfileProps()
 
 
 class MUV_CPUVProps():
@@ -91,11 +99,13 @@ class MUV_UVBBProps():
 
 class MUV_TexProjProps():
     running = False
+    canvas_cache = None
 
 
 class MUV_TexLockProps():
     verts_orig = None
-    intr_verts_orig = None
+    intr_vidx = None
+    intr_vco = None
     intr_running = False
 
 
@@ -106,6 +116,35 @@ class MUV_TexWrapProps():
 class MUV_WSUVProps():
     ref_sv = None
     ref_suv = None
+    ref_scale = None
+    ref_method = 'EDGE'
+    face_scales = None
+    report = None
+    report_cache = {}
+
+
+class MUV_PackUVProps():
+    group_cache = None
+
+
+class MUV_MirrorUVProps():
+    vert_map_key = None
+    vert_map = None
+    plane_key = None
+    plane = None
+
+
+class MUV_UVWProps():
+    box_map_cache = None
+    best_planer_cache = None
+
+
+class MUV_ProfileProps():
+    def __init__(self):
+        # feature name -> {phase name: elapsed time (sec)}
+        self.timings = {}
+        # feature name -> {counter name: value}
+        self.counters = {}
 
 
 def init_props(scene):
@@ -29,6 +29,7 @@ from math import (
     sqrt, sin, fabs,
 )
 
+import numpy as np
 import bpy
 import bmesh
 from mathutils import Vector
@@ -39,11 +40,19 @@ from . import muv_common
 def get_vco(verts_orig, loop):
     """
     Get vertex original coordinate from loop
+    (verts_orig holds original coordinates of vertices not processed yet)
     """
-    for vo in verts_orig:
-        if vo["vidx"] == loop.vert.index and vo["moved"] is False:
-            return vo["vco"]
-    return loop.vert.co
+    return verts_orig.get(loop.vert.index, loop.vert.co)
+
+
+def get_uv(uv_overlay, loop, uv_layer):
+    """
+    Get UV coordinate of loop
+    (uv_overlay holds UV coordinates computed but not written back yet)
+    """
+    if uv_overlay and loop in uv_overlay:
+        return uv_overlay[loop]
+    return loop[uv_layer].uv
 
 
 def get_link_loops(vert):
@@ -69,21 +78,22 @@ def get_link_loops(vert):
     return link_loops
 
 
-def get_ini_geom(link_loop, uv_layer, verts_orig, v_orig):
+def get_ini_geom(link_loop, uv_layer, verts_orig, vco_orig,
+                 uv_overlay=None):
     """
     Get initial geometory
     (Get interior angle of face in vertex/UV space)
     """
-    u = link_loop["l"][uv_layer].uv
+    u = get_uv(uv_overlay, link_loop["l"], uv_layer)
     v0 = get_vco(verts_orig, link_loop["l0"])
-    u0 = link_loop["l0"][uv_layer].uv
+    u0 = get_uv(uv_overlay, link_loop["l0"], uv_layer)
     v1 = get_vco(verts_orig, link_loop["l1"])
-    u1 = link_loop["l1"][uv_layer].uv
+    u1 = get_uv(uv_overlay, link_loop["l1"], uv_layer)
 
     # get interior angle of face in vertex space
     v0v1 = v1 - v0
-    v0v = v_orig["vco"] - v0
-    v1v = v_orig["vco"] - v1
+    v0v = vco_orig - v0
+    v1v = vco_orig - v1
     theta0 = v0v1.angle(v0v)
     theta1 = v0v1.angle(-v1v)
     if (theta0 + theta1) > math.pi:
@@ -114,7 +124,8 @@ def get_ini_geom(link_loop, uv_layer, verts_orig, v_orig):
         "dir1": dir1}
 
 
-def get_target_uv(link_loop, uv_layer, verts_orig, v, ini_geom):
+def get_target_uv(link_loop, uv_layer, verts_orig, v, ini_geom,
+                  uv_overlay=None):
     """
     Get target UV coordinate
     """
@@ -137,8 +148,8 @@ def get_target_uv(link_loop, uv_layer, verts_orig, v, ini_geom):
     phi0 = theta0 * ini_geom["phi0"] / ini_geom["theta0"]
     phi1 = theta1 * ini_geom["phi1"] / ini_geom["theta1"]
 
-    uv0 = lo0[uv_layer].uv
-    uv1 = lo1[uv_layer].uv
+    uv0 = get_uv(uv_overlay, lo0, uv_layer)
+    uv1 = get_uv(uv_overlay, lo1, uv_layer)
 
     # calculate target vertex coordinate from target interior angle
     tuv0, tuv1 = calc_tri_vert(uv0, uv1, phi0, phi1)
@@ -181,6 +192,29 @@ def calc_tri_vert(v0, v1, angle0, angle1):
     return Vector((x1, y1)), Vector((x2, y2))
 
 
+def calc_link_loop_uvs(v, uv_layer, verts_orig, vco_orig, uv_overlay=None):
+    """
+    Calculate target UV coordinates of loops linked to vertex
+    (Return None if vertex is degenerate)
+    """
+    link_loops = get_link_loops(v)
+    if not link_loops:
+        return None
+
+    result = []
+    try:
+        for ll in link_loops:
+            ini_geom = get_ini_geom(
+                ll, uv_layer, verts_orig, vco_orig, uv_overlay)
+            target_uv = get_target_uv(
+                ll, uv_layer, verts_orig, v, ini_geom, uv_overlay)
+            result.append({"l": ll["l"], "uv": target_uv})
+    except (ValueError, ZeroDivisionError):
+        return None
+
+    return result
+
+
 class MUV_TexLockStart(bpy.types.Operator):
     """
     Operation class: Start Texture Lock
@@ -242,24 +276,29 @@ class MUV_TexLockStop(bpy.types.Operator):
         uv_layer = bm.loops.layers.uv.verify()
 
         verts = [v.index for v in bm.verts if v.select]
-        verts_orig = props.verts_orig
-
-        # move UV followed by vertex coordinate
-        for vidx, v_orig in zip(verts, verts_orig):
+        verts_orig = {vo["vidx"]: vo["vco"] for vo in props.verts_orig}
+        timer = muv_common.PhaseTimer(
+            context.scene.muv_props.profile, "Texture Lock")
+
+        # compute target UV followed by vertex coordinate
+        # (vertices are solved in order and solved vertex is used as anchor
+        #  of next one, but UVs are not changed until all vertices are
+        #  solved)
+        uv_overlay = {}
+        num_solved = 0
+        num_skipped = 0
+        for vidx, v_orig in zip(verts, props.verts_orig):
             if vidx != v_orig["vidx"]:
                 self.report({'ERROR'}, "Internal Error")
                 return {"CANCELLED"}
 
             v = bm.verts[vidx]
-            link_loops = get_link_loops(v)
-
-            result = []
-
-            for ll in link_loops:
-                ini_geom = get_ini_geom(ll, uv_layer, verts_orig, v_orig)
-                target_uv = get_target_uv(
-                    ll, uv_layer, verts_orig, v, ini_geom)
-                result.append({"l": ll["l"], "uv": target_uv})
+            result = calc_link_loop_uvs(
+                v, uv_layer, verts_orig, v_orig["vco"], uv_overlay)
+            del verts_orig[vidx]
+            if result is None:
+                num_skipped = num_skipped + 1
+                continue
 
             # connect other face's UV
             if self.connect:
@@ -268,12 +307,25 @@ class MUV_TexLockStop(bpy.types.Operator):
                     ave = ave + r["uv"]
                 ave = ave / len(result)
                 for r in result:
-                    r["l"][uv_layer].uv = ave
+                    uv_overlay[r["l"]] = ave
             else:
                 for r in result:
-                    r["l"][uv_layer].uv = r["uv"]
-            v_orig["moved"] = True
-            bmesh.update_edit_mesh(obj.data)
+                    uv_overlay[r["l"]] = r["uv"]
+            num_solved = num_solved + 1
+        timer.lap("Compute")
+
+        # write back UV
+        for l, uv in uv_overlay.items():
+            l[uv_layer].uv = uv
+        bmesh.update_edit_mesh(obj.data)
+        timer.lap("Write Back")
+
+        timer.count("Solved", num_solved)
+        timer.count("Skipped", num_skipped)
+        self.report(
+            {'INFO'},
+            "Solved {0} vertices, skipped {1} degenerate vertices".format(
+                num_solved, num_skipped))
 
         return {'FINISHED'}
 
@@ -293,6 +345,7 @@ class MUV_TexLockUpdater(bpy.types.Operator):
     def __update_uv(self, context):
         """
         Update UV when vertex coordinates are changed
+        Only vertices moved since the last update are processed
         """
         props = context.scene.muv_props.texlock
         obj = bpy.context.active_object
@@ -307,23 +360,30 @@ class MUV_TexLockUpdater(bpy.types.Operator):
             return {'CANCELLED'}
         uv_layer = bm.loops.layers.uv.verify()
 
-        verts = [v.index for v in bm.verts if v.select]
-        verts_orig = props.intr_verts_orig
-
-        for vidx, v_orig in zip(verts, verts_orig):
-            if vidx != v_orig["vidx"]:
-                self.report({'ERROR'}, "Internal Error")
-                return {"CANCELLED"}
-
-            v = bm.verts[vidx]
-            link_loops = get_link_loops(v)
-
-            result = []
-            for ll in link_loops:
-                ini_geom = get_ini_geom(ll, uv_layer, verts_orig, v_orig)
-                target_uv = get_target_uv(
-                    ll, uv_layer, verts_orig, v, ini_geom)
-                result.append({"l": ll["l"], "uv": target_uv})
+        vidx = props.intr_vidx
+        if vidx.size == 0:
+            return {'FINISHED'}
+        if vidx[-1] >= len(bm.verts):
+            self.report({'ERROR'}, "Internal Error")
+            return {"CANCELLED"}
+
+        # detect moved vertices by comparing with previous coordinates
+        verts = [bm.verts[i] for i in vidx]
+        vco = muv_common.get_vert_co_array(verts)
+        moved = np.any(vco != props.intr_vco, axis=1)
+        if not moved.any():
+            return {'FINISHED'}
+        moved_indices = np.flatnonzero(moved)
+        verts_orig = {
+            verts[i].index: Vector(props.intr_vco[i]) for i in moved_indices}
+
+        for i in moved_indices:
+            v = verts[i]
+            result = calc_link_loop_uvs(
+                v, uv_layer, verts_orig, verts_orig[v.index])
+            if result is None:
+                del verts_orig[v.index]
+                continue
 
             # UV connect option is always true, because it raises
             # unexpected behavior
@@ -333,13 +393,13 @@ class MUV_TexLockUpdater(bpy.types.Operator):
             ave = ave / len(result)
             for r in result:
                 r["l"][uv_layer].uv = ave
-            v_orig["moved"] = True
-            bmesh.update_edit_mesh(obj.data)
+            del verts_orig[v.index]
 
+        props.intr_vco[moved] = vco[moved]
+        bmesh.update_edit_mesh(obj.data)
         muv_common.redraw_all_areas()
-        props.intr_verts_orig = [
-            {"vidx": v.index, "vco": v.co.copy(), "moved": False}
-            for v in bm.verts if v.select]
+
+        return {'FINISHED'}
 
     def modal(self, context, event):
         props = context.scene.muv_props.texlock
@@ -404,9 +464,10 @@ class MUV_TexLockIntrStart(bpy.types.Operator):
             self.report({'WARNING'}, "Object must have more than one UV map")
             return {'CANCELLED'}
 
-        props.intr_verts_orig = [
-            {"vidx": v.index, "vco": v.co.copy(), "moved": False}
-            for v in bm.verts if v.select]
+        sel_verts = [v for v in bm.verts if v.select]
+        props.intr_vidx = np.array(
+            [v.index for v in sel_verts], dtype=np.int64)
+        props.intr_vco = muv_common.get_vert_co_array(sel_verts)
 
         bpy.ops.uv.muv_texlock_updater()
 
@@ -23,13 +23,13 @@ __status__ = "production"
 __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
+import numpy as np
 import bpy
 import bgl
-import bmesh
 import mathutils
-from bpy_extras import view3d_utils
+from bpy.props import BoolProperty
 
 from . import muv_common
 
@@ -38,29 +38,24 @@ Rect = namedtuple('Rect', 'x0 y0 x1 y1')
 Rect2 = namedtuple('Rect2', 'x y width height')
 
 
-def get_canvas(context, magnitude):
+def calc_canvas(region_size, padding, tex_size, magnitude, adjust_window,
+                apply_tex_aspect):
     """
-    Get canvas to be renderred texture
+    Calculate canvas from region size, canvas padding and texture size
     """
-    sc = context.scene
-    prefs = context.user_preferences.addons["uv_magic_uv"].preferences
+    region_w, region_h = region_size
+    canvas_w = region_w - padding[0] * 2.0
+    canvas_h = region_h - padding[1] * 2.0
 
-    region_w = context.region.width
-    region_h = context.region.height
-    canvas_w = region_w - prefs.texproj_canvas_padding[0] * 2.0
-    canvas_h = region_h - prefs.texproj_canvas_padding[1] * 2.0
-
-    img = bpy.data.images[sc.muv_texproj_tex_image]
-    tex_w = img.size[0]
-    tex_h = img.size[1]
+    tex_w, tex_h = tex_size
 
     center_x = region_w * 0.5
     center_y = region_h * 0.5
 
-    if sc.muv_texproj_adjust_window:
+    if adjust_window:
         ratio_x = canvas_w / tex_w
         ratio_y = canvas_h / tex_h
-        if sc.muv_texproj_apply_tex_aspect:
+        if apply_tex_aspect:
             ratio = ratio_y if ratio_x > ratio_y else ratio_x
             len_x = ratio * tex_w
             len_y = ratio * tex_h
@@ -68,7 +63,7 @@ def get_canvas(context, magnitude):
             len_x = canvas_w
             len_y = canvas_h
     else:
-        if sc.muv_texproj_apply_tex_aspect:
+        if apply_tex_aspect:
             len_x = tex_w * magnitude
             len_y = tex_h * magnitude
         else:
@@ -83,6 +78,72 @@ def get_canvas(context, magnitude):
     return Rect(x0, y0, x1, y1)
 
 
+def get_canvas(context, magnitude):
+    """
+    Get canvas to be renderred texture
+    """
+    sc = context.scene
+    prefs = context.user_preferences.addons["uv_magic_uv"].preferences
+    img = bpy.data.images[sc.muv_texproj_tex_image]
+
+    return calc_canvas(
+        (context.region.width, context.region.height),
+        prefs.texproj_canvas_padding, img.size, magnitude,
+        sc.muv_texproj_adjust_window, sc.muv_texproj_apply_tex_aspect)
+
+
+class MUV_TexProjCanvasCache():
+    """
+    Custom class: Cache canvas and texture to be renderred
+    Canvas is recalculated only when region size, canvas padding, magnitude,
+    aspect options or texture image (including its size) is changed
+    """
+
+    def __init__(self, profile):
+        self.__key = None
+        self.__img = None
+        self.__rect = None
+        self.__counters = OrderedDict([("Hit", 0), ("Miss", 0)])
+        profile.counters["Texture Projection Canvas"] = self.__counters
+
+    def invalidate(self):
+        self.__key = None
+        self.__img = None
+        self.__rect = None
+
+    def get(self, context):
+        """
+        Get texture image and canvas
+        """
+        sc = context.scene
+        prefs = context.user_preferences.addons["uv_magic_uv"].preferences
+
+        # image is identified by its pointer, because image may be reloaded
+        # or recreated with same name
+        img = bpy.data.images[sc.muv_texproj_tex_image]
+        key = (
+            context.region.width,
+            context.region.height,
+            tuple(prefs.texproj_canvas_padding),
+            sc.muv_texproj_tex_magnitude,
+            sc.muv_texproj_adjust_window,
+            sc.muv_texproj_apply_tex_aspect,
+            img.as_pointer(),
+            tuple(img.size)
+        )
+        if key == self.__key:
+            self.__counters["Hit"] += 1
+            return self.__img, self.__rect
+
+        self.__counters["Miss"] += 1
+        self.__img = img
+        self.__rect = calc_canvas(
+            key[0:2], key[2], img.size, key[3], key[4], key[5])
+        self.__key = key
+
+        return self.__img, self.__rect
+
+
 def rect_to_rect2(rect):
     """
     Convert Rect1 to Rect2
@@ -91,17 +152,139 @@ def rect_to_rect2(rect):
     return Rect2(rect.x0, rect.y0, rect.x1 - rect.x0, rect.y1 - rect.y0)
 
 
-def region_to_canvas(rg_vec, canvas):
+def get_canvas_matrix(region, rv3d, canvas):
     """
-    Convert screen region to canvas
+    Get matrix to transform world space to canvas
+    (world -> view -> perspective -> screen region -> canvas)
     """
 
     cv_rect = rect_to_rect2(canvas)
-    cv_vec = mathutils.Vector()
-    cv_vec.x = (rg_vec.x - cv_rect.x) / cv_rect.width
-    cv_vec.y = (rg_vec.y - cv_rect.y) / cv_rect.height
+    half_w = region.width * 0.5
+    half_h = region.height * 0.5
+
+    # normalized device coordinate to canvas
+    ndc_to_canvas = np.array([
+        [half_w / cv_rect.width, 0.0, 0.0,
+         (half_w - cv_rect.x) / cv_rect.width],
+        [0.0, half_h / cv_rect.height, 0.0,
+         (half_h - cv_rect.y) / cv_rect.height],
+        [0.0, 0.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ])
+
+    return ndc_to_canvas.dot(np.array(rv3d.perspective_matrix))
 
-    return cv_vec
+
+def transform_coords(mat, co):
+    """
+    Transform (N, 3) coordinates by 4x4 matrix
+    """
+
+    m = np.array(mat)
+
+    return co.dot(m[:3, :3].T) + m[:3, 3]
+
+
+def project_to_canvas(mat, co):
+    """
+    Project (N, 3) coordinates to canvas
+    Return projected (N, 2) coordinates and mask of coordinates which are
+    in front of view
+    """
+
+    co4 = np.ones((len(co), 4))
+    co4[:, :3] = co
+    prj = co4.dot(mat.T)
+    valid = prj[:, 3] > 0.0
+    w = np.where(valid, prj[:, 3], 1.0)
+
+    return prj[:, :2] / w[:, np.newaxis], valid
+
+
+def get_world_bvhtree(targets):
+    """
+    Build BVH tree of all faces of objects in world space
+    targets is list of (object, BMesh)
+    """
+
+    co_list = []
+    polys = []
+    num_verts = 0
+    for o, bm in targets:
+        bm.verts.index_update()
+        co_list.append(transform_coords(
+            o.matrix_world, muv_common.get_vert_co_array(bm.verts)))
+        polys.extend(
+            [v.index + num_verts for v in f.verts] for f in bm.faces)
+        num_verts = num_verts + len(bm.verts)
+    co = np.concatenate(co_list) if co_list else np.zeros((0, 3))
+
+    return mathutils.bvhtree.BVHTree.FromPolygons(co.tolist(), polys)
+
+
+def get_visible_face_mask(bm, faces, world_mat, rv3d, bvh):
+    """
+    Get mask of faces which are visible from view
+    Faces facing away from view are culled at first, and then vertices of
+    rest faces are tested by ray casting to BVH tree in world space, which
+    is built from all target objects by get_world_bvhtree()
+    """
+
+    mat_inv = world_mat.inverted()
+    view_inv = rv3d.view_matrix.inverted()
+
+    # cull back faces (evaluated in object space)
+    normals = np.array(
+        [f.normal[:] for f in faces], dtype=np.float64).reshape(-1, 3)
+    if rv3d.is_perspective:
+        eye = np.array((mat_inv * view_inv.translation)[:])
+        centers = np.array(
+            [f.calc_center_median()[:] for f in faces],
+            dtype=np.float64).reshape(-1, 3)
+        front = np.einsum('ij,ij->i', normals, eye - centers) > 0.0
+    else:
+        view_dir = mat_inv.to_3x3() * view_inv.to_3x3() * \
+            mathutils.Vector((0.0, 0.0, -1.0))
+        view_dir = np.array(view_dir.normalized()[:])
+        front = normals.dot(view_dir) < 0.0
+
+    # vertices to be tested
+    front_faces = [f for f, m in zip(faces, front) if m and not f.hide]
+    vidx = np.unique(np.array(
+        [v.index for f in front_faces for v in f.verts], dtype=np.int64))
+    co = transform_coords(world_mat, muv_common.get_vert_co_array(
+        [bm.verts[i] for i in vidx]))
+
+    # cast ray from vertex to view in world space
+    # ray origin is slightly moved toward view to avoid hitting itself
+    if rv3d.is_perspective:
+        dirs = np.array(view_inv.translation[:]) - co
+        dists = np.linalg.norm(dirs, axis=1)
+        dirs = dirs / np.maximum(dists, 1e-12)[:, np.newaxis]
+    else:
+        view_dir = view_inv.to_3x3() * mathutils.Vector((0.0, 0.0, -1.0))
+        dirs = np.tile(-np.array(view_dir.normalized()[:]), (len(co), 1))
+        dists = np.full(len(co), 1.0e30)
+    if len(co) > 0:
+        diag = np.linalg.norm(co.max(axis=0) - co.min(axis=0))
+    else:
+        diag = 0.0
+    offset = max(diag * 1.0e-4, 1.0e-6)
+    origins = co + dirs * offset
+    dists = np.maximum(dists - offset, 0.0)
+
+    ray_cast = bvh.ray_cast
+    visible = np.fromiter(
+        (ray_cast(o, d, l)[0] is None
+         for o, d, l in zip(origins.tolist(), dirs.tolist(), dists.tolist())),
+        dtype=np.bool_, count=len(co))
+
+    vert_visible = np.zeros(len(bm.verts), dtype=np.bool_)
+    vert_visible[vidx] = visible
+    visible_faces = set(
+        f for f in front_faces if any(vert_visible[v.index] for v in f.verts))
+
+    return [f in visible_faces for f in faces]
 
 
 class MUV_TexProjRenderer(bpy.types.Operator):
@@ -137,11 +320,9 @@ class MUV_TexProjRenderer(bpy.types.Operator):
         if sc.muv_texproj_tex_image == "None":
             return
 
-        # get texture to be renderred
-        img = bpy.data.images[sc.muv_texproj_tex_image]
-
-        # setup rendering region
-        rect = get_canvas(context, sc.muv_texproj_tex_magnitude)
+        # get texture to be renderred and setup rendering region
+        cache = sc.muv_props.texproj.canvas_cache
+        img, rect = cache.get(context)
         positions = [
             [rect.x0, rect.y0],
             [rect.x0, rect.y1],
@@ -190,6 +371,8 @@ class MUV_TexProjStart(bpy.types.Operator):
     def execute(self, context):
         props = context.scene.muv_props.texproj
         if props.running is False:
+            props.canvas_cache = MUV_TexProjCanvasCache(
+                context.scene.muv_props.profile)
             MUV_TexProjRenderer.handle_add(self, context)
             props.running = True
         if context.area:
@@ -213,6 +396,8 @@ class MUV_TexProjStop(bpy.types.Operator):
         if props.running is True:
             MUV_TexProjRenderer.handle_remove()
             props.running = False
+        if props.canvas_cache is not None:
+            props.canvas_cache.invalidate()
         if context.area:
             context.area.tag_redraw()
 
@@ -229,6 +414,18 @@ class MUV_TexProjProject(bpy.types.Operator):
     bl_description = "Project Texture"
     bl_options = {'REGISTER', 'UNDO'}
 
+    visible_only = BoolProperty(
+        name="Visible Faces Only",
+        description="Project texture only to faces visible from view",
+        default=False
+    )
+    multi_object = BoolProperty(
+        name="Selected Objects",
+        description="Project texture to all selected mesh objects "
+                    "(All faces are projected in objects not in edit mode)",
+        default=False
+    )
+
     @classmethod
     def poll(cls, context):
         obj = context.active_object
@@ -248,50 +445,83 @@ class MUV_TexProjProject(bpy.types.Operator):
         _, region, space = muv_common.get_space(
             'VIEW_3D', 'WINDOW', 'VIEW_3D')
 
-        # get faces to be texture projected
         obj = context.active_object
-        world_mat = obj.matrix_world
-        bm = bmesh.from_edit_mesh(obj.data)
-        if muv_common.check_version(2, 73, 0) >= 0:
-            bm.faces.ensure_lookup_table()
-
-        # get UV and texture layer
-        if not bm.loops.layers.uv:
-            self.report({'WARNING'}, "Object must have more than one UV map")
-            return {'CANCELLED'}
-
-        uv_layer = bm.loops.layers.uv.verify()
-        tex_layer = bm.faces.layers.tex.verify()
+        timer = muv_common.PhaseTimer(
+            sc.muv_props.profile, "Texture Projection")
 
-        sel_faces = [f for f in bm.faces if f.select]
-
-        # transform 3d space to screen region
-        v_screen = [
-            view3d_utils.location_3d_to_region_2d(
-                region,
-                space.region_3d,
-                world_mat * l.vert.co)
-            for f in sel_faces for l in f.loops
-        ]
-
-        # transform screen region to canvas
-        v_canvas = [
-            region_to_canvas(
-                v,
-                get_canvas(bpy.context, sc.muv_texproj_tex_magnitude))
-            for v in v_screen
-        ]
+        if self.multi_object:
+            objs = muv_common.get_selected_mesh_objects(context)
+        else:
+            objs = [obj]
 
-        # project texture to object
-        i = 0
-        for f in sel_faces:
-            f[tex_layer].image = bpy.data.images[sc.muv_texproj_tex_image]
-            for l in f.loops:
-                l[uv_layer].uv = v_canvas[i].to_2d()
-                i = i + 1
+        # get faces to be texture projected
+        bms = []
+        num_skipped = 0
+        for o in objs:
+            bm = muv_common.get_object_bmesh(o)
+            if not bm.loops.layers.uv:
+                if o == obj:
+                    self.report(
+                        {'WARNING'}, "Object must have more than one UV map")
+                    return {'CANCELLED'}
+                if not o.data.is_editmode:
+                    bm.free()
+                num_skipped = num_skipped + 1
+                continue
+            bms.append((o, bm))
+
+        # faces hidden behind any target object are not visible
+        if self.visible_only:
+            bvh = get_world_bvhtree(bms)
+
+        # gather coordinates of all objects in world space
+        targets = []
+        co_list = []
+        num_sel_faces = 0
+        for o, bm in bms:
+            faces = muv_common.get_object_target_faces(o, bm)
+            num_sel_faces = num_sel_faces + len(faces)
+            if self.visible_only:
+                mask = get_visible_face_mask(
+                    bm, faces, o.matrix_world, space.region_3d, bvh)
+                faces = [f for f, m in zip(faces, mask) if m]
+            loops = [l for f in faces for l in f.loops]
+            targets.append((o, bm, faces, loops))
+            co_list.append(transform_coords(
+                o.matrix_world, muv_common.get_loop_co_array(loops)))
+        timer.lap("Gather")
+        timer.count("Objects", len(targets))
+        timer.count("Selected Faces", num_sel_faces)
+        timer.count("Projected Faces", sum(len(t[2]) for t in targets))
+
+        # transform 3d space to canvas
+        canvas = get_canvas(bpy.context, sc.muv_texproj_tex_magnitude)
+        mat = get_canvas_matrix(region, space.region_3d, canvas)
+        v_canvas, valid = project_to_canvas(mat, np.concatenate(co_list))
+        timer.lap("Project")
+
+        # project texture to objects
+        img = bpy.data.images[sc.muv_texproj_tex_image]
+        start = 0
+        for o, bm, faces, loops in targets:
+            end = start + len(loops)
+            uv_layer = bm.loops.layers.uv.verify()
+            tex_layer = bm.faces.layers.tex.verify()
+            for f in faces:
+                f[tex_layer].image = img
+            muv_common.set_loop_uv_array(
+                [l for l, v in zip(loops, valid[start:end]) if v], uv_layer,
+                v_canvas[start:end][valid[start:end]])
+            muv_common.update_object_bmesh(o, bm)
+            start = end
+        timer.lap("Write Back")
 
         muv_common.redraw_all_areas()
-        bmesh.update_edit_mesh(obj.data)
+
+        if num_skipped > 0:
+            self.report(
+                {'WARNING'},
+                "{0} objects without UV map are skipped".format(num_skipped))
 
         return {'FINISHED'}
 
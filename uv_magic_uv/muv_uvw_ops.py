@@ -26,9 +26,11 @@ __date__ = "19 Nov 2017"
 
 from math import sin, cos, pi
 
+import numpy as np
 import bpy
 import bmesh
 from bpy.props import (
+    EnumProperty,
     FloatProperty,
     FloatVectorProperty
 )
@@ -37,6 +39,147 @@ from mathutils import Vector
 from . import muv_common
 
 
+def get_box_map_geometry(faces):
+    """
+    Get loops, vertex coordinates of loops, and the dominant axis of face
+    normal and its direction for each loop
+    """
+    loops = [l for f in faces for l in f.loops]
+    co = muv_common.get_loop_co_array(loops)
+    normals = np.array(
+        [f.normal[:] for f in faces], dtype=np.float64).reshape(-1, 3)
+
+    # X is prior to Y, and Y is prior to Z when components are same
+    axis = np.argmax(np.abs(normals), axis=1)
+    positive = normals[np.arange(len(faces)), axis] >= 0.0
+    num_loops = [len(f.loops) for f in faces]
+
+    return (loops, co, np.repeat(axis, num_loops),
+            np.repeat(positive, num_loops))
+
+
+def calc_box_map_uvs(co, axis, positive, size, rotation, offset, aspect):
+    """
+    Calculate UV coordinates by box mapping
+    rotation is specified in degrees around each axis
+    """
+    xyz = co / size
+    offset = np.array(offset[:], dtype=np.float64)
+    rot = np.array(rotation[:], dtype=np.float64) * pi / 180.0
+
+    # coordinates on the plane perpendicular to the dominant axis
+    plane = np.array([[1, 2], [0, 2], [0, 1]])[axis]
+    rows = np.arange(len(co))
+    p = xyz[rows, plane[:, 0]]
+    q = xyz[rows, plane[:, 1]]
+    op = offset[plane[:, 0]]
+    oq = offset[plane[:, 1]]
+    c = np.cos(rot)[axis]
+    s = np.sin(rot)[axis]
+    sign = np.where(positive != (axis == 1), 1.0, -1.0)
+
+    u = sign * (p - op) * c + (q - oq) * s
+    v = -sign * (p * aspect - op) * s + (q * aspect - oq) * c
+
+    # Z-plane (negative direction)
+    zn = (axis == 2) & ~positive
+    u[zn] = -(p[zn] - op[zn]) * c[zn] - (q[zn] + oq[zn]) * s[zn]
+    v[zn] = -(p[zn] * aspect + op[zn]) * s[zn] + \
+        (q[zn] * aspect - oq[zn]) * c[zn]
+
+    return np.column_stack((u, v))
+
+
+def get_best_planer_geometry(faces, uv_layer, grouping):
+    """
+    Get loops, vertex coordinates of loops, and group of each loop and the
+    rotation matrix which rotates average normal of each group to Z axis
+    """
+    loops = [l for f in faces for l in f.loops]
+    co = muv_common.get_loop_co_array(loops)
+    normals = np.array(
+        [f.normal[:] for f in faces], dtype=np.float64).reshape(-1, 3)
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum([len(f.loops) for f in faces], out=offsets[1:])
+
+    if grouping == 'SELECTION':
+        labels = np.zeros(len(faces), dtype=np.int64)
+        num_groups = 1
+    else:
+        vidx = np.array([l.vert.index for l in loops], dtype=np.int64)
+        if grouping == 'UV_ISLAND':
+            uvs = muv_common.get_loop_uv_array(loops, uv_layer)
+        else:
+            uvs = np.zeros((len(loops), 2))
+        labels, num_groups = muv_common.get_island_labels(
+            vidx, uvs, offsets)
+
+    # calculate average of normal
+    n_ave = np.zeros((num_groups, 3))
+    for i in range(3):
+        n_ave[:, i] = np.bincount(labels, normals[:, i], minlength=num_groups)
+    z = Vector((0.0, 0.0, 1.0))
+    mats = np.array(
+        [Vector(n).rotation_difference(z).to_matrix() for n in n_ave],
+        dtype=np.float64).reshape(-1, 3, 3)
+
+    return loops, co, np.repeat(labels, np.diff(offsets)), mats
+
+
+def calc_best_planer_uvs(co, labels, mats, size, rotation, offset, aspect):
+    """
+    Calculate UV coordinates by planer mapping after rotating coordinates
+    by the matrix of each group
+    rotation is specified in degrees
+    """
+    rotated = np.einsum('lij,lj->li', mats[labels], co) / size
+    rz = rotation * pi / 180.0
+    x = rotated[:, 0]
+    y = rotated[:, 1]
+
+    u = x * cos(rz) - y * sin(rz) + offset[0]
+    v = -x * aspect * sin(rz) - y * aspect * cos(rz) + offset[1]
+
+    return np.column_stack((u, v))
+
+
+def get_geometry_fingerprint(bm, uv_layer=None):
+    """
+    Get fingerprint of coordinates of selected vertices (and UV coordinates
+    of selected faces if uv_layer is specified) to detect change of mesh
+    """
+    co = muv_common.get_vert_co_array([v for v in bm.verts if v.select])
+    if uv_layer is None:
+        return hash(co.tobytes())
+    uvs = muv_common.get_loop_uv_array(
+        [l for f in bm.faces if f.select for l in f.loops], uv_layer)
+    return hash(co.tobytes()), hash(uvs.tobytes())
+
+
+def get_cached_geometry(context, obj, bm, cache_name, options, gather_fn,
+                        *args):
+    """
+    Get geometry gathered by gather_fn, which is cached while same faces
+    are selected and options (including fingerprint of mesh) are not
+    changed
+    Loops are fetched from face indices because BMesh data is invalidated
+    by undo/redo
+    """
+    props = context.scene.muv_props.uvw
+    sel = [i for i, f in enumerate(bm.faces) if f.select]
+    key = (obj.data.name, len(bm.verts), len(bm.faces), hash(tuple(sel)),
+           options)
+    cache = getattr(props, cache_name)
+    if cache is not None and cache[0] == key:
+        loops = [l for i in sel for l in bm.faces[i].loops]
+        return (loops,) + cache[1], True
+
+    geom = gather_fn([bm.faces[i] for i in sel], *args)
+    setattr(props, cache_name, (key, geom[1:]))
+
+    return geom, False
+
+
 class MUV_UVWBoxMap(bpy.types.Operator):
     bl_idname = "uv.muv_uvw_box_map"
     bl_label = "Box Map"
@@ -68,6 +211,12 @@ class MUV_UVWBoxMap(bpy.types.Operator):
         obj = context.active_object
         return obj and obj.type == 'MESH'
 
+    def invoke(self, context, _):
+        # gather geometry again on new operation, and reuse it while
+        # properties are changed from redo panel
+        context.scene.muv_props.uvw.box_map_cache = None
+        return self.execute(context)
+
     def execute(self, context):
         obj = context.active_object
         bm = bmesh.from_edit_mesh(obj.data)
@@ -82,62 +231,21 @@ class MUV_UVWBoxMap(bpy.types.Operator):
 
         uv_layer = bm.loops.layers.uv.verify()
 
-        scale = 1.0 / self.size
-
-        sx = 1.0 * scale
-        sy = 1.0 * scale
-        sz = 1.0 * scale
-        ofx = self.offset[0]
-        ofy = self.offset[1]
-        ofz = self.offset[2]
-        rx = self.rotation[0] * pi / 180.0
-        ry = self.rotation[1] * pi / 180.0
-        rz = self.rotation[2] * pi / 180.0
-        aspect = self.tex_aspect
-
-        sel_faces = [f for f in bm.faces if f.select]
+        timer = muv_common.PhaseTimer(
+            context.scene.muv_props.profile, "UVW Box Map")
+        (loops, co, axis, positive), cached = get_cached_geometry(
+            context, obj, bm, "box_map_cache",
+            (get_geometry_fingerprint(bm),), get_box_map_geometry)
+        timer.lap("Gather")
+        timer.count("Cached", int(cached))
 
         # update UV coordinate
-        for f in sel_faces:
-            n = f.normal
-            for l in f.loops:
-                co = l.vert.co
-                x = co.x * sx
-                y = co.y * sy
-                z = co.z * sz
-
-                # X-plane
-                if abs(n[0]) >= abs(n[1]) and abs(n[0]) >= abs(n[2]):
-                    if n[0] >= 0.0:
-                        u = (y - ofy) * cos(rx) + (z - ofz) * sin(rx)
-                        v = -(y * aspect - ofy) * sin(rx) +\
-                            (z * aspect - ofz) * cos(rx)
-                    else:
-                        u = -(y - ofy) * cos(rx) + (z - ofz) * sin(rx)
-                        v = (y * aspect - ofy) * sin(rx) +\
-                            (z * aspect - ofz) * cos(rx)
-                # Y-plane
-                elif abs(n[1]) >= abs(n[0]) and abs(n[1]) >= abs(n[2]):
-                    if n[1] >= 0.0:
-                        u = -(x - ofx) * cos(ry) + (z - ofz) * sin(ry)
-                        v = (x * aspect - ofx) * sin(ry) +\
-                            (z * aspect - ofz) * cos(ry)
-                    else:
-                        u = (x - ofx) * cos(ry) + (z - ofz) * sin(ry)
-                        v = -(x * aspect - ofx) * sin(ry) +\
-                            (z * aspect - ofz) * cos(ry)
-                # Z-plane
-                else:
-                    if n[2] >= 0.0:
-                        u = (x - ofx) * cos(rz) + (y - ofy) * sin(rz)
-                        v = -(x * aspect - ofx) * sin(rz) +\
-                            (y * aspect - ofy) * cos(rz)
-                    else:
-                        u = -(x - ofx) * cos(rz) - (y + ofy) * sin(rz)
-                        v = -(x * aspect + ofx) * sin(rz) +\
-                            (y * aspect - ofy) * cos(rz)
-
-                l[uv_layer].uv = Vector((u, v))
+        uvs = calc_box_map_uvs(
+            co, axis, positive, self.size, self.rotation, self.offset,
+            self.tex_aspect)
+        timer.lap("Map")
+        muv_common.set_loop_uv_array(loops, uv_layer, uvs)
+        timer.lap("Write Back")
 
         bmesh.update_edit_mesh(obj.data)
 
@@ -168,12 +276,29 @@ class MUV_UVWBestPlanerMap(bpy.types.Operator):
         default=1.0,
         precision=4
     )
+    grouping = EnumProperty(
+        name="Plane",
+        description="Faces which share the best plane",
+        items=[
+            ('SELECTION', "Selection", "One plane for all selected faces"),
+            ('CONNECTED', "Connected Faces",
+             "One plane for each group of connected faces"),
+            ('UV_ISLAND', "UV Island", "One plane for each UV island")
+        ],
+        default='SELECTION'
+    )
 
     @classmethod
     def poll(cls, context):
         obj = context.active_object
         return obj and obj.type == 'MESH'
 
+    def invoke(self, context, _):
+        # gather geometry again on new operation, and reuse it while
+        # properties are changed from redo panel
+        context.scene.muv_props.uvw.best_planer_cache = None
+        return self.execute(context)
+
     def execute(self, context):
         obj = context.active_object
         bm = bmesh.from_edit_mesh(obj.data)
@@ -188,34 +313,23 @@ class MUV_UVWBestPlanerMap(bpy.types.Operator):
 
         uv_layer = bm.loops.layers.uv.verify()
 
-        scale = 1.0 / self.size
-
-        sx = 1.0 * scale
-        sy = 1.0 * scale
-        ofx = self.offset[0]
-        ofy = self.offset[1]
-        rz = self.rotation * pi / 180.0
-        aspect = self.tex_aspect
-
-        sel_faces = [f for f in bm.faces if f.select]
-
-        # calculate average of normal
-        n_ave = Vector((0.0, 0.0, 0.0))
-        for f in sel_faces:
-            n_ave = n_ave + f.normal
-        q = n_ave.rotation_difference(Vector((0.0, 0.0, 1.0)))
+        timer = muv_common.PhaseTimer(
+            context.scene.muv_props.profile, "UVW Best Planer Map")
+        (loops, co, labels, mats), cached = get_cached_geometry(
+            context, obj, bm, "best_planer_cache",
+            (self.grouping, get_geometry_fingerprint(
+                bm, uv_layer if self.grouping == 'UV_ISLAND' else None)),
+            get_best_planer_geometry, uv_layer, self.grouping)
+        timer.lap("Gather")
+        timer.count("Cached", int(cached))
 
         # update UV coordinate
-        for f in sel_faces:
-            for l in f.loops:
-                co = q * l.vert.co
-                x = co.x * sx
-                y = co.y * sy
-
-                u = x * cos(rz) - y * sin(rz) + ofx
-                v = -x * aspect * sin(rz) - y * aspect * cos(rz) + ofy
-
-                l[uv_layer].uv = Vector((u, v))
+        uvs = calc_best_planer_uvs(
+            co, labels, mats, self.size, self.rotation, self.offset,
+            self.tex_aspect)
+        timer.lap("Map")
+        muv_common.set_loop_uv_array(loops, uv_layer, uvs)
+        timer.lap("Write Back")
 
         bmesh.update_edit_mesh(obj.data)
 
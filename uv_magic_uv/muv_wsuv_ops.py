@@ -24,39 +24,184 @@ __version__ = "4.5"
 __date__ = "19 Nov 2017"
 
 
+import csv
+import json
+from collections import OrderedDict
+
+import numpy as np
 import bpy
 import bmesh
-from mathutils import Vector
 from bpy.props import (
     FloatProperty,
     BoolProperty,
-    EnumProperty
+    EnumProperty,
+    IntProperty,
+    StringProperty
 )
 from . import muv_common
 
 
-def calc_edge_scale(uv_layer, loop0, loop1):
-    v0 = loop0.vert.co
-    v1 = loop1.vert.co
-    uv0 = loop0[uv_layer].uv.copy()
-    uv1 = loop1[uv_layer].uv.copy()
+def get_face_arrays(faces, uv_layer):
+    """
+    Get vertex coordinates and UVs of loops in faces, and offsets of the
+    first loop of each face
+    """
+    loops = [l for f in faces for l in f.loops]
+    co = muv_common.get_loop_co_array(loops)
+    uv = muv_common.get_loop_uv_array(loops, uv_layer)
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum([len(f.loops) for f in faces], out=offsets[1:])
 
-    dv = v1 - v0
-    duv = uv1 - uv0
+    return loops, co, uv, offsets
 
-    scale = 0.0
-    if dv.magnitude > 0.00000001:
-        scale = duv.magnitude / dv.magnitude
 
-    return scale
+def calc_face_scales(co, uv, offsets):
+    """
+    Calculate scale of each face as sum of ratio of UV edge length to
+    3D edge length
+    Edge from the last loop to the first loop of face is not counted
+    """
+    if len(offsets) <= 1:
+        return np.zeros(0)
 
+    dv = np.zeros(len(co))
+    duv = np.zeros(len(co))
+    dv[:-1] = np.linalg.norm(co[1:] - co[:-1], axis=1)
+    duv[:-1] = np.linalg.norm(uv[1:] - uv[:-1], axis=1)
 
-def calc_face_scale(uv_layer, face):
-    es = 0.0
-    for i, l in enumerate(face.loops[1:]):
-        es = es + calc_edge_scale(uv_layer, face.loops[i], l)
+    ratio = np.zeros(len(co))
+    valid = dv > 0.00000001
+    ratio[valid] = duv[valid] / dv[valid]
+    ratio[offsets[1:] - 1] = 0.0
 
-    return es
+    return np.add.reduceat(ratio, offsets[:-1])
+
+
+def calc_face_areas(co, uv, offsets):
+    """
+    Calculate 3D area and UV area of each face
+    Face is triangulated as a fan from the first loop
+    """
+    if len(offsets) <= 1:
+        return np.zeros(0), np.zeros(0)
+
+    first = np.repeat(offsets[:-1], np.diff(offsets))
+    rel = co - co[first]
+    rel_uv = uv - uv[first]
+
+    cross = np.zeros((len(co), 3))
+    cross_uv = np.zeros(len(uv))
+    cross[:-1] = np.cross(rel[:-1], rel[1:])
+    cross_uv[:-1] = rel_uv[:-1, 0] * rel_uv[1:, 1] - \
+        rel_uv[:-1, 1] * rel_uv[1:, 0]
+    cross[offsets[1:] - 1] = 0.0
+    cross_uv[offsets[1:] - 1] = 0.0
+
+    area = 0.5 * np.linalg.norm(
+        np.add.reduceat(cross, offsets[:-1]), axis=1)
+    area_uv = 0.5 * np.abs(np.add.reduceat(cross_uv, offsets[:-1]))
+
+    return area, area_uv
+
+
+def calc_face_densities(method, co, uv, offsets):
+    """
+    Calculate texel density of each face
+    """
+    if method == 'AREA':
+        area, area_uv = calc_face_areas(co, uv, offsets)
+        density = np.zeros(len(area))
+        valid = area > 0.0
+        density[valid] = np.sqrt(area_uv[valid] / area[valid])
+        return density
+
+    return calc_face_scales(co, uv, offsets)
+
+
+def calc_group_densities(method, co, uv, offsets, labels, num_groups):
+    """
+    Calculate texel density of each group of faces
+    Area based density is calculated from total areas of group
+    """
+    if method == 'AREA':
+        area, area_uv = calc_face_areas(co, uv, offsets)
+        area = np.bincount(labels, area, minlength=num_groups)
+        area_uv = np.bincount(labels, area_uv, minlength=num_groups)
+        density = np.zeros(num_groups)
+        valid = area > 0.0
+        density[valid] = np.sqrt(area_uv[valid] / area[valid])
+        return density
+
+    scales = calc_face_scales(co, uv, offsets)
+    return np.bincount(labels, scales, minlength=num_groups) / \
+        np.bincount(labels, minlength=num_groups)
+
+
+def get_mesh_arrays(obj, world_space):
+    """
+    Get vertex coordinates and UVs of loops, offsets of faces and material
+    indices of faces from mesh data
+    """
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    num_loops = len(mesh.loops)
+    num_faces = len(mesh.polygons)
+
+    vco = np.empty(num_verts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", vco)
+    vco = vco.reshape(-1, 3).astype(np.float64)
+    if world_space:
+        mat = np.array(obj.matrix_world, dtype=np.float64)
+        vco = vco.dot(mat[:3, :3].T) + mat[:3, 3]
+    vidx = np.empty(num_loops, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", vidx)
+    uv = np.empty(num_loops * 2, dtype=np.float32)
+    mesh.uv_layers.active.data.foreach_get("uv", uv)
+    loop_start = np.empty(num_faces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    loop_total = np.empty(num_faces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mat_idx = np.empty(num_faces, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", mat_idx)
+
+    # arrange loops in order of faces
+    offsets = np.zeros(num_faces + 1, dtype=np.int64)
+    np.cumsum(loop_total, out=offsets[1:])
+    loop_idx = np.repeat(loop_start - offsets[:-1], loop_total) + \
+        np.arange(offsets[-1])
+
+    return (vco[vidx[loop_idx]], uv.reshape(-1, 2)[loop_idx].astype(
+        np.float64), offsets, mat_idx)
+
+
+def calc_stats(values, weights, bins):
+    """
+    Calculate statistics of texel density
+    """
+    if len(values) == 0:
+        return None
+    mean = np.average(values, weights=weights) if weights.sum() > 0.0 \
+        else values.mean()
+
+    return OrderedDict([
+        ("faces", int(len(values))),
+        ("min", float(values.min())),
+        ("mean", float(mean)),
+        ("max", float(values.max())),
+        ("p5", float(np.percentile(values, 5))),
+        ("p50", float(np.percentile(values, 50))),
+        ("p95", float(np.percentile(values, 95))),
+        ("histogram", [int(c) for c in np.histogram(values, bins)[0]])
+    ])
+
+
+def get_method_items():
+    return [
+        ('EDGE', "Edge Length",
+         "Sum of ratio of UV edge length to 3D edge length per face"),
+        ('AREA', "Area",
+         "Square root of ratio of UV area to 3D area")
+    ]
 
 
 class MUV_WSUVMeasure(bpy.types.Operator):
@@ -69,6 +214,13 @@ class MUV_WSUVMeasure(bpy.types.Operator):
     bl_description = "Measure face size for scale calculation"
     bl_options = {'REGISTER', 'UNDO'}
 
+    method = EnumProperty(
+        name="Method",
+        description="How to measure face size",
+        items=get_method_items(),
+        default='EDGE'
+    )
+
     def execute(self, context):
         props = context.scene.muv_props.wsuv
         obj = bpy.context.active_object
@@ -84,13 +236,17 @@ class MUV_WSUVMeasure(bpy.types.Operator):
         uv_layer = bm.loops.layers.uv.verify()
 
         sel_faces = [f for f in bm.faces if f.select]
+        if not sel_faces:
+            self.report({'WARNING'}, "Face must be selected")
+            return {'CANCELLED'}
 
         # measure average face size
-        scale = 0.0
-        for f in sel_faces:
-            scale = scale + calc_face_scale(uv_layer, f)
-
-        props.ref_scale = scale / len(sel_faces)
+        _, co, uv, offsets = get_face_arrays(sel_faces, uv_layer)
+        props.face_scales = calc_face_densities(self.method, co, uv, offsets)
+        props.ref_scale = float(calc_group_densities(
+            self.method, co, uv, offsets,
+            np.zeros(len(sel_faces), dtype=np.int64), 1)[0])
+        props.ref_method = self.method
 
         self.report(
             {'INFO'}, "Average face size: {0}".format(props.ref_scale))
@@ -135,10 +291,25 @@ class MUV_WSUVApply(bpy.types.Operator):
         ],
         default="CENTER"
     )
+    method = EnumProperty(
+        name="Method",
+        description="How to measure face size",
+        items=get_method_items(),
+        default='EDGE'
+    )
+    per_island = BoolProperty(
+        name="Per Island",
+        description="Scale each UV island about its own origin",
+        default=False
+    )
 
     def draw(self, _):
         layout = self.layout
 
+        row = layout.row()
+        row.prop(self, "method")
+        row = layout.row()
+        row.prop(self, "per_island")
         row = layout.row()
         row.prop(self, "proportional_scaling")
         row = layout.row()
@@ -162,109 +333,231 @@ class MUV_WSUVApply(bpy.types.Operator):
         uv_layer = bm.loops.layers.uv.verify()
 
         sel_faces = [f for f in bm.faces if f.select]
+        if not sel_faces:
+            self.report({'WARNING'}, "Face must be selected")
+            return {'CANCELLED'}
+
+        if self.proportional_scaling:
+            if props.ref_scale is None:
+                self.report({'WARNING'}, "Face size must be measured")
+                return {'CANCELLED'}
+            if props.ref_method != self.method:
+                self.report(
+                    {'WARNING'},
+                    "Face size was measured by different method")
+                return {'CANCELLED'}
+
+        # group faces
+        loops, co, uv, offsets = get_face_arrays(sel_faces, uv_layer)
+        if self.per_island:
+            vidx = np.array([l.vert.index for l in loops], dtype=np.int64)
+            labels, num_groups = muv_common.get_island_labels(
+                vidx, uv, offsets)
+        else:
+            labels = np.zeros(len(sel_faces), dtype=np.int64)
+            num_groups = 1
 
         # measure average face size
-        scale = 0.0
-        for f in sel_faces:
-            scale = scale + calc_face_scale(uv_layer, f)
-        scale = scale / len(sel_faces)
+        scales = calc_group_densities(
+            self.method, co, uv, offsets, labels, num_groups)
 
         self.report(
-            {'INFO'}, "Average face size: {0}".format(scale))
+            {'INFO'}, "Average face size: {0}".format(scales.mean()))
 
         if self.proportional_scaling:
-            factor = props.ref_scale / scale
+            factors = np.ones(num_groups)
+            valid = scales > 0.0
+            factors[valid] = props.ref_scale / scales[valid]
         else:
-            factor = self.scaling_factor
+            factors = np.full(num_groups, self.scaling_factor)
 
         # calculate origin
-        if self.origin == 'CENTER':
-            origin = Vector((0.0, 0.0))
-            num = 0
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin = origin + uv
-                    num = num + 1
-            origin = origin / num
-        elif self.origin == 'LEFT_TOP':
-            origin = Vector((100000.0, -100000.0))
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = min(origin.x, uv.x)
-                    origin.y = max(origin.y, uv.y)
-        elif self.origin == 'LEFT_CENTER':
-            origin = Vector((100000.0, 0.0))
-            num = 0
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = min(origin.x, uv.x)
-                    origin.y = origin.y + uv.y
-                    num = num + 1
-            origin.y = origin.y / num
-        elif self.origin == 'LEFT_BOTTOM':
-            origin = Vector((100000.0, 100000.0))
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = min(origin.x, uv.x)
-                    origin.y = min(origin.y, uv.y)
-        elif self.origin == 'CENTER_TOP':
-            origin = Vector((0.0, -100000.0))
-            num = 0
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = origin.x + uv.x
-                    origin.y = max(origin.y, uv.y)
-                    num = num + 1
-            origin.x = origin.x / num
-        elif self.origin == 'CENTER_BOTTOM':
-            origin = Vector((0.0, 100000.0))
-            num = 0
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = origin.x + uv.x
-                    origin.y = min(origin.y, uv.y)
-                    num = num + 1
-            origin.x = origin.x / num
-        elif self.origin == 'RIGHT_TOP':
-            origin = Vector((-100000.0, -100000.0))
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = max(origin.x, uv.x)
-                    origin.y = max(origin.y, uv.y)
-        elif self.origin == 'RIGHT_CENTER':
-            origin = Vector((-100000.0, 0.0))
-            num = 0
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = max(origin.x, uv.x)
-                    origin.y = origin.y + uv.y
-                    num = num + 1
-            origin.y = origin.y / num
-        elif self.origin == 'RIGHT_BOTTOM':
-            origin = Vector((-100000.0, 100000.0))
-            for f in sel_faces:
-                for l in f.loops:
-                    uv = l[uv_layer].uv
-                    origin.x = max(origin.x, uv.x)
-                    origin.y = min(origin.y, uv.y)
+        loop_labels = np.repeat(labels, np.diff(offsets))
+        origins = muv_common.get_uv_anchors(
+            uv, loop_labels, num_groups)[self.origin]
 
         # update UV coordinate
-        for f in sel_faces:
-            for l in f.loops:
-                uv = l[uv_layer].uv
-                diff = uv - origin
-                l[uv_layer].uv = origin + diff * factor
+        uv = muv_common.scale_uv_groups(
+            uv, loop_labels, origins, factors[:, np.newaxis])
+        muv_common.set_loop_uv_array(loops, uv_layer, uv)
 
         bmesh.update_edit_mesh(obj.data)
 
-        self.report({'INFO'}, "Scaling factor: {0}".format(factor))
+        self.report(
+            {'INFO'}, "Scaling factor: {0}".format(factors.mean()))
 
         return {'FINISHED'}
+
+
+class MUV_WSUVReport(bpy.types.Operator):
+    """
+    Operation class: Report texel density of all meshes in scene
+    """
+
+    bl_idname = "uv.muv_wsuv_report"
+    bl_label = "Density Report"
+    bl_description = "Report texel density of all meshes in scene " \
+                     "per object and material"
+    bl_options = {'REGISTER'}
+
+    method = EnumProperty(
+        name="Method",
+        description="How to measure face size",
+        items=get_method_items(),
+        default='AREA'
+    )
+    world_space = BoolProperty(
+        name="World Space",
+        description="Measure 3D size in world space",
+        default=True
+    )
+    num_bins = IntProperty(
+        name="Histogram Bins",
+        description="Number of bins of histogram",
+        default=10,
+        min=1,
+        max=100
+    )
+    file_format = EnumProperty(
+        name="Format",
+        description="Format of exported report",
+        items=[
+            ('CSV', "CSV", "Export as CSV"),
+            ('JSON', "JSON", "Export as JSON")
+        ],
+        default='CSV'
+    )
+    filepath = StringProperty(
+        name="File Path",
+        description="Export report to this file (Not exported if empty)",
+        default="",
+        subtype='FILE_PATH'
+    )
+
+    def __get_densities(self, context, obj):
+        """
+        Get texel density and area of each face
+        Result is cached per object and mesh until mesh data, object
+        transform or options are changed
+        """
+        cache = context.scene.muv_props.wsuv.report_cache
+        co, uv, offsets, mat_idx = get_mesh_arrays(obj, self.world_space)
+        key = (
+            self.method,
+            self.world_space,
+            tuple(tuple(r) for r in obj.matrix_world),
+            hash(co.tobytes()),
+            hash(uv.tobytes()),
+            hash(offsets.tobytes()),
+            hash(mat_idx.tobytes())
+        )
+        cached = cache.get((obj.name, obj.data.name))
+        if cached is not None and cached[0] == key:
+            return cached[1], True
+
+        densities = calc_face_densities(self.method, co, uv, offsets)
+        areas, _ = calc_face_areas(co, uv, offsets)
+        result = (densities, areas, mat_idx)
+        cache[(obj.name, obj.data.name)] = (key, result)
+
+        return result, False
+
+    def execute(self, context):
+        props = context.scene.muv_props.wsuv
+        timer = muv_common.PhaseTimer(
+            context.scene.muv_props.profile, "Density Report")
+
+        # measure texel density per mesh
+        measured = []
+        num_cached = 0
+        for obj in context.scene.objects:
+            if obj.type != 'MESH':
+                continue
+            if obj.mode == 'EDIT':
+                obj.update_from_editmode()
+            if not obj.data.uv_layers.active or not obj.data.polygons:
+                continue
+            result, cached = self.__get_densities(context, obj)
+            num_cached += cached
+            measured.append((obj, result))
+        for name in set(props.report_cache) - \
+                set((obj.name, obj.data.name) for obj, _ in measured):
+            del props.report_cache[name]
+        timer.lap("Measure")
+        timer.count("Objects", len(measured))
+        timer.count("Cached", num_cached)
+        if not measured:
+            self.report({'WARNING'}, "No mesh object with UV map")
+            return {'CANCELLED'}
+
+        # collect statistics per object and material
+        all_densities = np.concatenate([r[0] for _, r in measured])
+        bins = np.linspace(
+            all_densities.min(), all_densities.max(), self.num_bins + 1)
+        objects = []
+        materials = OrderedDict()
+        for obj, (densities, areas, mat_idx) in measured:
+            stats = calc_stats(densities, areas, bins)
+            stats["name"] = obj.name
+            objects.append(stats)
+            for i in np.unique(mat_idx).tolist():
+                slots = obj.material_slots
+                mtrl = slots[i].material if i < len(slots) else None
+                name = mtrl.name if mtrl else "None"
+                mask = mat_idx == i
+                materials.setdefault(name, ([], []))
+                materials[name][0].append(densities[mask])
+                materials[name][1].append(areas[mask])
+        for name, (densities, areas) in materials.items():
+            stats = calc_stats(
+                np.concatenate(densities), np.concatenate(areas), bins)
+            stats["name"] = name
+            materials[name] = stats
+
+        props.report = OrderedDict([
+            ("method", self.method),
+            ("bins", bins.tolist()),
+            ("objects", objects),
+            ("materials", list(materials.values()))
+        ])
+        timer.lap("Statistics")
+
+        if self.filepath:
+            path = bpy.path.abspath(self.filepath)
+            try:
+                if self.file_format == 'JSON':
+                    self.__export_json(path, props.report)
+                else:
+                    self.__export_csv(path, props.report)
+            except (IOError, OSError) as e:
+                self.report({'WARNING'}, "Failed to export: {0}".format(e))
+                return {'CANCELLED'}
+            timer.lap("Export")
+
+        self.report(
+            {'INFO'},
+            "Density: min {0:.4f}, mean {1:.4f}, max {2:.4f} "
+            "({3} objects, {4} cached)".format(
+                all_densities.min(), all_densities.mean(),
+                all_densities.max(), len(measured), num_cached))
+
+        return {'FINISHED'}
+
+    def __export_json(self, path, report):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    def __export_csv(self, path, report):
+        columns = ["faces", "min", "mean", "max", "p5", "p50", "p95"]
+        num_bins = len(report["bins"]) - 1
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                ["type", "name"] + columns +
+                ["bin{0}".format(i) for i in range(num_bins)])
+            for type_, key in (("object", "objects"),
+                               ("material", "materials")):
+                for stats in report[key]:
+                    writer.writerow(
+                        [type_, stats["name"]] +
+                        [stats[c] for c in columns] + stats["histogram"])